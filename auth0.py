@@ -1,29 +1,109 @@
 import pulumi
+from invokes import Lookups
 from schema import (
-    EnvType,
+    Auth0ScopeMode,
     FullStackDeployment,
+    ResolvedEnvironment,
     WebappAuthType,
 )
 import pulumi_auth0 as auth0
 import pulumi_random as random
 
 default_entity_permissions = ["create", "read", "update", "delete", "list", "analytics"]
+default_scopes = ["openid", "profile", "email", "offline_access"]
 
 
-def setup_auth0(env_type: EnvType, config: FullStackDeployment) -> dict:
-    resource_prefix = f"{env_type.value}-{config.project_name}-"
-    auth0_domain = list(filter(lambda x: x.env_type == env_type, config.providers))[
-        0
-    ].provider.auth0.domain
+def entity_scopes(entities: list[str]) -> list[dict]:
+    return [
+        {
+            "name": f"{permission}:{entity}",
+            "description": f"{permission} permission for {entity}",
+        }
+        for entity in entities
+        for permission in default_entity_permissions
+    ]
+
+
+def resolve_role_permissions(config: FullStackDeployment) -> dict[str, list[str]]:
+    """
+    Expands the role -> "permission:entity" matrix, where either side may be
+    "*" (a bare "*" grants everything), into the concrete scope names.
+    """
+    resolved: dict[str, list[str]] = {}
+    for role, grants in config.role_permissions.items():
+        if role not in config.roles:
+            raise ValueError(f"Unknown role '{role}' in role_permissions")
+
+        scopes: list[str] = []
+        for grant in grants:
+            permission, _, entity = (grant if grant != "*" else "*:*").partition(":")
+            if permission != "*" and permission not in default_entity_permissions:
+                raise ValueError(f"Unknown permission in '{grant}' for role '{role}'")
+            if entity != "*" and entity not in config.entities:
+                raise ValueError(f"Unknown entity in '{grant}' for role '{role}'")
+
+            for scope_entity in config.entities if entity == "*" else [entity]:
+                for scope_permission in (
+                    default_entity_permissions if permission == "*" else [permission]
+                ):
+                    name = f"{scope_permission}:{scope_entity}"
+                    if name not in scopes:
+                        scopes.append(name)
+        resolved[role] = scopes
+    return resolved
+
+
+def setup_resource_server_scopes(
+    resource_prefix: str,
+    resource_server: auth0.ResourceServer,
+    scopes: list[dict],
+    mode: Auth0ScopeMode,
+) -> list[pulumi.Resource]:
+    scope_resources: list[pulumi.Resource] = []
+
+    if mode in [Auth0ScopeMode.per_scope, Auth0ScopeMode.migrate]:
+        for scope in scopes:
+            scope_resources.append(
+                auth0.ResourceServerScope(
+                    resource_name=resource_prefix + f"auth0-scope-{scope['name']}",
+                    description=scope["description"],
+                    resource_server_identifier=resource_server.identifier,
+                    scope=scope["name"],
+                    opts=pulumi.ResourceOptions(
+                        retain_on_delete=mode == Auth0ScopeMode.migrate
+                    ),
+                )
+            )
+
+    if mode in [Auth0ScopeMode.migrate, Auth0ScopeMode.bulk]:
+        scope_resources.append(
+            auth0.ResourceServerScopes(
+                resource_name=resource_prefix + "auth0-scopes",
+                resource_server_identifier=resource_server.identifier,
+                scopes=scopes,
+                opts=pulumi.ResourceOptions(depends_on=list(scope_resources)),
+            )
+        )
+
+    return scope_resources
+
+
+def setup_auth0(
+    env: ResolvedEnvironment, config: FullStackDeployment, lookups: Lookups
+) -> dict:
+    resource_prefix = env.resource_prefix
+    auth0_domain = env.provider.auth0.domain
     resource_server = auth0.ResourceServer(
         resource_name=resource_prefix + "auth0-resource-server",
-        identifier=f"https://{env_type.value}-api-{config.project_name}.{config.main_domain}",
+        identifier=env.api_identifier,
         name=resource_prefix + "api",
         signing_alg="RS256",
         allow_offline_access=True,
         token_lifetime=8600,
         skip_consent_for_verifiable_first_party_clients=True,
         enforce_policies=True,
+        # Adds the role permissions to the access token's permissions claim.
+        token_dialect="access_token_authz" if config.role_permissions else None,
     )
 
     auth0_rest_api_client = auth0.Client(
@@ -36,29 +116,47 @@ def setup_auth0(env_type: EnvType, config: FullStackDeployment) -> dict:
         },
     )
 
-    auth0_rest_api_client_secret = auth0.get_client(
-        client_id=auth0_rest_api_client.client_id,
-    ).client_secret
+    auth0_rest_api_client_secret = lookups.auth0_client_secret(
+        auth0_rest_api_client.client_id
+    )
 
-    roles_dict: dict = {}
+    role_permissions = resolve_role_permissions(config)
+
+    roles: dict[str, auth0.Role] = {}
     for role in config.roles:
-        roles_dict[role] = auth0.Role(
+        roles[role] = auth0.Role(
             resource_name=resource_prefix + f"auth0-role-{role}",
             name=role,
-            description=f"{role} role for {env_type.value}",
-        ).id
-
-    scopes: list[str] = ["openid", "profile", "email", "offline_access"]
-    for entity in config.entities:
-        for permission in default_entity_permissions:
-            name = f"{permission}:{entity}"
-            auth0.ResourceServerScope(
-                resource_name=resource_prefix + f"auth0-scope-{name}",
-                description=f"{permission} permission for {entity}",
-                resource_server_identifier=resource_server.identifier,
-                scope=name,
-            )
-            scopes.append(name)
+            description=f"{role} role for {env.env_type.value}",
+        )
+    roles_dict: dict = {role: roles[role].id for role in config.roles}
+
+    resource_server_scopes = entity_scopes(config.entities)
+    scope_resources = setup_resource_server_scopes(
+        resource_prefix,
+        resource_server,
+        resource_server_scopes,
+        config.auth0_scope_mode,
+    )
+    scopes: list[str] = default_scopes + [
+        scope["name"] for scope in resource_server_scopes
+    ]
+
+    for role, permissions in role_permissions.items():
+        if not permissions:
+            continue
+        auth0.RolePermissions(
+            resource_name=resource_prefix + f"auth0-role-permissions-{role}",
+            role_id=roles[role].id,
+            permissions=[
+                {
+                    "name": permission,
+                    "resource_server_identifier": resource_server.identifier,
+                }
+                for permission in permissions
+            ],
+            opts=pulumi.ResourceOptions(depends_on=scope_resources),
+        )
 
     auth0.ClientGrant(
         resource_name=resource_prefix + "auth0-management-api-client-grant",
@@ -99,7 +197,7 @@ def setup_auth0(env_type: EnvType, config: FullStackDeployment) -> dict:
         resource_name=resource_prefix + "auth0-api-client-grant",
         client_id=auth0_rest_api_client.client_id,
         audience=resource_server.identifier,
-        scopes=[scope for scope in scopes],
+        scopes=scopes,
     )
 
     generated_secret = random.RandomUuid(
@@ -108,36 +206,8 @@ def setup_auth0(env_type: EnvType, config: FullStackDeployment) -> dict:
 
     webapps: list[dict] = []
     for webapp in config.webapps:
-        hosts = []
-        base_url = ""
-
-        if env_type == EnvType.local:
-            base_url = f"http://localhost:{webapp.dev_port}"
-            hosts = [base_url]
-
-        if env_type in EnvType.dev:
-            base_url = f"https://qa-{webapp.name}.{config.main_domain}"
-            hosts = [
-                base_url,
-            ]
-
-        if env_type in EnvType.staging:
-            base_url = f"https://staging-{webapp.name}.{config.main_domain}"
-            hosts = [
-                base_url,
-            ]
-
-        if env_type == EnvType.prod and webapp.is_root is False:
-            base_url = f"https://{webapp.name}.{config.main_domain}"
-            hosts = [
-                base_url,
-            ]
-
-        if env_type == EnvType.prod and webapp.is_root is True:
-            base_url = f"https://{config.main_domain}"
-            hosts = [
-                base_url,
-            ]
+        base_url = env.webapp_urls[webapp.name]
+        hosts = [base_url] if base_url else []
 
         webapp_client = auth0.Client(
             resource_name=resource_prefix + f"auth0-webapp-client-{webapp.name}",
@@ -169,9 +239,7 @@ def setup_auth0(env_type: EnvType, config: FullStackDeployment) -> dict:
             else "deny",
         )
 
-        webapp_client_secret = auth0.get_client(
-            client_id=webapp_client.client_id,
-        ).client_secret
+        webapp_client_secret = lookups.auth0_client_secret(webapp_client.client_id)
 
         webapps.append(
             {
@@ -186,9 +254,8 @@ def setup_auth0(env_type: EnvType, config: FullStackDeployment) -> dict:
             }
         )
 
-    db_connection = auth0.get_connection(name="Username-Password-Authentication")
-
-    google_connection = auth0.get_connection(name="google-oauth2")
+    db_connection_id = lookups.auth0_connection_id("Username-Password-Authentication")
+    google_connection_id = lookups.auth0_connection_id("google-oauth2")
 
     output = {
         "audience": resource_server.identifier,
@@ -198,9 +265,13 @@ def setup_auth0(env_type: EnvType, config: FullStackDeployment) -> dict:
             "client_id": auth0_rest_api_client.client_id,
             "client_secret": auth0_rest_api_client_secret,
         },
-        "db_connection_id": db_connection.id,
-        "google_connection_id": google_connection.id,
+        "db_connection_id": db_connection_id,
+        "google_connection_id": google_connection_id,
         "roles": roles_dict,
+        "role_permissions": {
+            role: " ".join(permissions)
+            for role, permissions in role_permissions.items()
+        },
     }
 
     for webapp in webapps:
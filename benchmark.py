@@ -0,0 +1,205 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import pulumi
+from invokes import StaticLookups
+from providers import get_common_provider, get_dev_provider, get_local_provider
+from pulumi_create_stack import create_pulumi_program, import_report
+from schema import (
+    EnvInstanceType,
+    EnvProviders,
+    EnvType,
+    FullStackDeployment,
+    InstancesType,
+    Webapp,
+    WebappAuthType,
+    resolve_environment,
+)
+
+baseline_path = Path(__file__).parent / "benchmark_baseline.json"
+
+# (entities, webapps, roles) per scenario.
+scenarios = {
+    "small": (5, 3, 4),
+    "medium": (50, 10, 20),
+    "large": (500, 50, 100),
+}
+
+mock_outputs = {
+    "auth0:index/client:Client": {"clientId": "mock-client-id"},
+    "auth0:index/resourceServer:ResourceServer": {
+        "identifier": "https://mock-api.example.com",
+    },
+    "digitalocean:index/kubernetesCluster:KubernetesCluster": {
+        "kubeConfigs": [{"rawConfig": "apiVersion: v1\nkind: Config\n"}],
+        "clusterUrn": "do:kubernetes:mock",
+    },
+    "digitalocean:index/databaseCluster:DatabaseCluster": {
+        "host": "mock-db.example.com",
+        "privateHost": "private-mock-db.example.com",
+        "port": 25060,
+        "user": "doadmin",
+        "password": "mock-password",
+        "version": "16",
+        "clusterUrn": "do:dbaas:mock",
+    },
+    "ec:index/deployment:Deployment": {
+        "elasticsearch": {"httpsEndpoint": "https://mock-es.example.com"},
+        "elasticsearchUsername": "elastic",
+        "elasticsearchPassword": "mock-password",
+    },
+}
+
+
+class BenchmarkMocks(pulumi.runtime.Mocks):
+    def __init__(self) -> None:
+        self.resources = 0
+
+    def new_resource(self, args: pulumi.runtime.MockResourceArgs):
+        self.resources += 1
+        outputs = {**args.inputs, **mock_outputs.get(args.typ, {})}
+        return [f"{args.name}-id", outputs]
+
+    def call(self, args: pulumi.runtime.MockCallArgs):
+        # Lookups are served by StaticLookups, no invoke reaches the mocks.
+        return {}
+
+
+def synthetic_config(entities: int, webapps: int, roles: int) -> FullStackDeployment:
+    return FullStackDeployment(
+        project_name="bench",
+        env_types=[EnvType.common, EnvType.local, EnvType.dev],
+        instances=[
+            EnvInstanceType(instances=InstancesType(), env_type=EnvType.dev),
+        ],
+        webapps=[
+            Webapp(
+                name=f"webapp-{i}",
+                auth_type=WebappAuthType.b2b if i % 2 else WebappAuthType.b2c,
+                dev_port=3000 + i,
+                is_root=i == 0,
+            )
+            for i in range(webapps)
+        ],
+        roles=[f"role-{i}" for i in range(roles)],
+        entities=[f"entity-{i}" for i in range(entities)],
+        main_domain="bench.example.com",
+        providers=[
+            EnvProviders(env_type=EnvType.common, provider=get_common_provider()),
+            EnvProviders(env_type=EnvType.local, provider=get_local_provider()),
+            EnvProviders(env_type=EnvType.dev, provider=get_dev_provider()),
+        ],
+    )
+
+
+def run_program(env: EnvType, config: FullStackDeployment) -> dict:
+    mocks = BenchmarkMocks()
+    pulumi.runtime.set_mocks(mocks, project=config.project_name, stack=env.value)
+
+    resolved = resolve_environment(config, env)
+    # SDK import cost is measured separately by measure_imports.
+    import_report(env)
+
+    @pulumi.runtime.test
+    def program():
+        create_pulumi_program(resolved, config, StaticLookups(resolved))
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    program()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds": seconds,
+        "peak_mb": peak / (1024 * 1024),
+        "resources": mocks.resources,
+    }
+
+
+def measure_imports(env: EnvType) -> dict[str, float]:
+    # Runs in a fresh interpreter so already imported SDKs are not hidden.
+    output = subprocess.run(
+        [sys.executable, "pulumi_create_stack.py", env.value],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output)
+
+
+def run_benchmarks(envs: list[EnvType]) -> dict:
+    results: dict = {
+        "imports": {
+            env.value: {"seconds": sum(measure_imports(env).values())} for env in envs
+        }
+    }
+    for scenario, (entities, webapps, roles) in scenarios.items():
+        config = synthetic_config(entities, webapps, roles)
+        results[scenario] = {env.value: run_program(env, config) for env in envs}
+    return results
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    found = []
+    for scenario, envs in results.items():
+        for env, result in envs.items():
+            expected = baseline.get(scenario, {}).get(env)
+            if expected is None:
+                continue
+            for metric in ["seconds", "peak_mb"]:
+                if metric not in result:
+                    continue
+                if result[metric] > expected[metric] * (1 + tolerance):
+                    found.append(
+                        f"{scenario}/{env}: {metric} {result[metric]:.3f} > "
+                        f"baseline {expected[metric]:.3f}"
+                    )
+            if "resources" in result and result["resources"] != expected["resources"]:
+                found.append(
+                    f"{scenario}/{env}: resources {result['resources']} != "
+                    f"baseline {expected['resources']}"
+                )
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--env",
+        action="append",
+        type=EnvType,
+        help="env to benchmark, may be repeated (default: common, local, dev)",
+    )
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.env or [EnvType.common, EnvType.local, EnvType.dev])
+    for env, result in results["imports"].items():
+        print(f"{'imports':<8} {env:<8} {result['seconds']:8.3f}s")
+    for scenario in scenarios:
+        for env, result in results[scenario].items():
+            print(
+                f"{scenario:<8} {env:<8} {result['seconds']:8.3f}s "
+                f"{result['peak_mb']:8.1f}MB {result['resources']:6d} resources"
+            )
+
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"baseline written to {baseline_path.name}")
+    elif baseline_path.exists():
+        found = regressions(
+            results, json.loads(baseline_path.read_text()), args.tolerance
+        )
+        for regression in found:
+            print(f"regression: {regression}")
+        if found:
+            raise SystemExit(1)
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from pydantic import BaseModel
+
+chart_cache_dir = Path(__file__).parent / ".charts"
+chart_index_path = chart_cache_dir / "index.json"
+chart_index_lock = threading.Lock()
+
+
+class HelmChart(BaseModel):
+    chart: str
+    version: str
+    # Charts without a repo are pulled from an OCI reference in `chart`.
+    repo: str | None = None
+
+    @property
+    def ref(self) -> str:
+        return f"{self.repo or ''}{self.chart}@{self.version}"
+
+
+# Every chart KubernetesSetup installs, keyed by the name used in the program.
+chart_manifest: dict[str, HelmChart] = {
+    "kubernetes-dashboard": HelmChart(
+        chart="kubernetes-dashboard",
+        version="7.10.4",
+        repo="https://kubernetes.github.io/dashboard/",
+    ),
+    "keda": HelmChart(
+        chart="keda", version="2.16.1", repo="https://kedacore.github.io/charts"
+    ),
+    "metrics-server": HelmChart(
+        chart="metrics-server",
+        version="3.12.2",
+        repo="https://kubernetes-sigs.github.io/metrics-server",
+    ),
+    "kube-state-metrics": HelmChart(
+        chart="kube-state-metrics",
+        version="5.30.0",
+        repo="https://prometheus-community.github.io/helm-charts",
+    ),
+    "cert-manager": HelmChart(
+        chart="cert-manager", version="v1.17.0", repo="https://charts.jetstack.io"
+    ),
+    "external-dns": HelmChart(
+        chart="oci://registry-1.docker.io/bitnamicharts/external-dns",
+        version="8.7.5",
+    ),
+    "rabbitmq": HelmChart(
+        chart="oci://registry-1.docker.io/bitnamicharts/rabbitmq",
+        version="15.3.0",
+    ),
+    "connect": HelmChart(
+        chart="connect",
+        version="1.17.0",
+        repo="https://1password.github.io/connect-helm-charts",
+    ),
+    "kubernetes-ingress": HelmChart(
+        chart="kubernetes-ingress",
+        version="1.44.0",
+        repo="https://haproxytech.github.io/helm-charts",
+    ),
+    "prometheus": HelmChart(
+        chart="prometheus",
+        version="27.5.0",
+        repo="https://prometheus-community.github.io/helm-charts",
+    ),
+    "datadog": HelmChart(
+        chart="datadog", version="3.100.0", repo="https://helm.datadoghq.com"
+    ),
+}
+
+
+def read_chart_index() -> dict[str, str]:
+    if not chart_index_path.exists():
+        return {}
+    try:
+        return json.loads(chart_index_path.read_text())
+    except json.JSONDecodeError:
+        return {}
+
+
+def cached_chart_path(chart: HelmChart) -> Path | None:
+    """
+    Archives are stored under their sha256, the index maps a chart reference
+    to its digest. An archive whose content no longer matches is ignored.
+    """
+    digest = read_chart_index().get(chart.ref)
+    if digest is None:
+        return None
+    path = chart_cache_dir / "sha256" / f"{digest}.tgz"
+    if not path.is_file() or hashlib.sha256(path.read_bytes()).hexdigest() != digest:
+        return None
+    return path
+
+
+def chart_args(name: str) -> dict:
+    """
+    Keyword arguments for helm.v4.Chart. The cached archive is used when
+    present, otherwise the pinned version is fetched from the repository.
+    """
+    chart = chart_manifest[name]
+    path = cached_chart_path(chart)
+    if path is not None:
+        return {"chart": str(path)}
+
+    args: dict = {"chart": chart.chart, "version": chart.version}
+    if chart.repo:
+        args["repository_opts"] = {"repo": chart.repo}
+    return args
+
+
+def pull_chart(chart: HelmChart) -> str:
+    with tempfile.TemporaryDirectory() as destination:
+        command = ["helm", "pull", chart.chart, "--version", chart.version]
+        if chart.repo:
+            command += ["--repo", chart.repo]
+        subprocess.run(
+            command + ["--destination", destination],
+            check=True,
+            capture_output=True,
+        )
+        (archive,) = Path(destination).glob("*.tgz")
+        digest = hashlib.sha256(archive.read_bytes()).hexdigest()
+        blob_dir = chart_cache_dir / "sha256"
+        blob_dir.mkdir(parents=True, exist_ok=True)
+        shutil.move(archive, blob_dir / f"{digest}.tgz")
+
+    with chart_index_lock:
+        index = read_chart_index()
+        index[chart.ref] = digest
+        chart_index_path.write_text(json.dumps(index, indent=2, sort_keys=True))
+    return f"{chart.chart}@{chart.version}"
+
+
+def missing_charts() -> list[HelmChart]:
+    return [
+        chart for chart in chart_manifest.values() if cached_chart_path(chart) is None
+    ]
+
+
+def populate_chart_cache(max_workers: int = 4) -> list[str]:
+    missing = missing_charts()
+    if not missing:
+        return []
+    if shutil.which("helm") is None:
+        print("helm not found, charts will be fetched from their repositories")
+        return []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(pull_chart, missing))
+
+
+if __name__ == "__main__":
+    for pulled in populate_chart_cache():
+        print(f"cached {pulled}")
@@ -0,0 +1,119 @@
+from typing import Any
+
+import pulumi
+from pulumi.dynamic import (
+    CreateResult,
+    DiffResult,
+    Resource,
+    ResourceProvider,
+    UpdateResult,
+)
+
+
+class ClusterReadinessProvider(ResourceProvider):
+    """
+    Polls the cluster API until the requested number of nodes report Ready and
+    CoreDNS has ready replicas. Deleting is a no-op, so teardown never waits.
+    """
+
+    def ready_state(self, kubeconfig: str) -> tuple[int, bool]:
+        import base64
+        import json
+        import ssl
+        import urllib.request
+
+        import yaml
+
+        config = yaml.safe_load(kubeconfig)
+        cluster = config["clusters"][0]["cluster"]
+        token = config["users"][0]["user"]["token"]
+        context = ssl.create_default_context(
+            cadata=base64.b64decode(cluster["certificate-authority-data"]).decode()
+        )
+
+        def get(path: str) -> dict:
+            request = urllib.request.Request(
+                cluster["server"] + path,
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            with urllib.request.urlopen(request, context=context, timeout=10) as res:
+                return json.loads(res.read())
+
+        ready_nodes = sum(
+            1
+            for node in get("/api/v1/nodes").get("items", [])
+            if any(
+                condition["type"] == "Ready" and condition["status"] == "True"
+                for condition in node.get("status", {}).get("conditions", [])
+            )
+        )
+        coredns = get("/apis/apps/v1/namespaces/kube-system/deployments/coredns")
+        dns_ready = coredns.get("status", {}).get("readyReplicas", 0) > 0
+        return ready_nodes, dns_ready
+
+    def wait(self, props: dict) -> dict:
+        import time
+
+        deadline = time.monotonic() + props["timeout_seconds"]
+        ready_nodes, dns_ready, error = 0, False, None
+        while time.monotonic() < deadline:
+            try:
+                ready_nodes, dns_ready = self.ready_state(props["kubeconfig"])
+                error = None
+            except Exception as e:
+                error = e
+            if ready_nodes >= props["node_count"] and dns_ready:
+                return {**props, "ready_nodes": ready_nodes}
+            time.sleep(props["poll_interval_seconds"])
+
+        raise TimeoutError(
+            f"Cluster not ready after {props['timeout_seconds']}s: "
+            f"{ready_nodes}/{props['node_count']} nodes ready, "
+            f"coredns ready: {dns_ready}, last error: {error}"
+        )
+
+    def create(self, props: dict) -> CreateResult:
+        return CreateResult(id_="cluster-readiness", outs=self.wait(props))
+
+    def diff(self, _id: str, olds: dict, news: dict) -> DiffResult:
+        changed = [
+            key
+            for key in ["kubeconfig", "node_count"]
+            if olds.get(key) != news.get(key)
+        ]
+        return DiffResult(
+            changes=bool(changed), replaces=[], delete_before_replace=False
+        )
+
+    def update(self, _id: str, _olds: dict, news: dict) -> UpdateResult:
+        return UpdateResult(outs=self.wait(news))
+
+
+class ClusterReadiness(Resource):
+    kubeconfig: pulumi.Output[str]
+    ready_nodes: pulumi.Output[int]
+
+    def __init__(
+        self,
+        resource_name: str,
+        kubeconfig: pulumi.Input[str],
+        node_count: pulumi.Input[int],
+        timeout_seconds: int = 600,
+        poll_interval_seconds: int = 10,
+        opts: pulumi.ResourceOptions | None = None,
+    ) -> None:
+        props: dict[str, Any] = {
+            "kubeconfig": kubeconfig,
+            "node_count": node_count,
+            "timeout_seconds": timeout_seconds,
+            "poll_interval_seconds": poll_interval_seconds,
+            "ready_nodes": None,
+        }
+        super().__init__(
+            ClusterReadinessProvider(),
+            resource_name,
+            props,
+            pulumi.ResourceOptions.merge(
+                opts, pulumi.ResourceOptions(additional_secret_outputs=["kubeconfig"])
+            ),
+        )
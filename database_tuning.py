@@ -0,0 +1,82 @@
+import re
+
+
+def size_resources(size: str) -> tuple[int, int]:
+    """
+    vCPUs and GiB of RAM of a DigitalOcean size slug such as db-s-2vcpu-4gb.
+    """
+    vcpus = re.search(r"(\d+)vcpu", size)
+    memory = re.search(r"(\d+)gb$", size)
+    if not vcpus or not memory:
+        raise ValueError(f"Cannot derive vCPUs and memory from size '{size}'")
+    return int(vcpus.group(1)), int(memory.group(1))
+
+
+def oltp_small(vcpus: int, memory_gb: int) -> dict:
+    return {
+        "work_mem": max(4, memory_gb * 4),
+        "shared_buffers_percentage": 25,
+        "max_parallel_workers": vcpus,
+        "max_parallel_workers_per_gather": max(1, vcpus // 2),
+        "idle_in_transaction_session_timeout": 60000,
+        "log_min_duration_statement": 1000,
+    }
+
+
+def oltp_large(vcpus: int, memory_gb: int) -> dict:
+    return {
+        "work_mem": max(8, memory_gb * 8),
+        "shared_buffers_percentage": 30,
+        "max_parallel_workers": vcpus,
+        "max_parallel_workers_per_gather": max(2, vcpus // 2),
+        "idle_in_transaction_session_timeout": 30000,
+        "log_min_duration_statement": 500,
+        "track_io_timing": "on",
+    }
+
+
+def pubsub_buffer_limit(memory_gb: int) -> int:
+    # Hard limit in MB, DigitalOcean accepts 32 to 512.
+    return min(512, max(32, memory_gb * 64))
+
+
+def cache_lru(vcpus: int, memory_gb: int) -> dict:
+    return {
+        "valkey_maxmemory_policy": "allkeys-lru",
+        "timeout": 300,
+        "persistence": "off",
+        "io_threads": max(1, vcpus),
+        "pubsub_client_output_buffer_limit": pubsub_buffer_limit(memory_gb),
+    }
+
+
+def celery_results(vcpus: int, memory_gb: int) -> dict:
+    # Results carry a TTL, only those are evicted so pending results survive.
+    # Workers hold their connections open, idle ones are closed after an hour
+    # on the small sizes and kept on the larger ones.
+    return {
+        "valkey_maxmemory_policy": "volatile-ttl",
+        "timeout": 3600 if memory_gb < 4 else 0,
+        "persistence": "rdb",
+        "io_threads": max(1, vcpus),
+        "pubsub_client_output_buffer_limit": pubsub_buffer_limit(memory_gb),
+    }
+
+
+postgres_profiles = {
+    "oltp-small": oltp_small,
+    "oltp-large": oltp_large,
+}
+
+valkey_profiles = {
+    "cache-lru": cache_lru,
+    "celery-results": celery_results,
+}
+
+
+def tuning_values(profiles: dict, profile: str, size: str) -> dict:
+    if profile not in profiles:
+        raise ValueError(
+            f"Unknown tuning profile '{profile}', expected one of {list(profiles)}"
+        )
+    return profiles[profile](*size_resources(size))
@@ -1,16 +1,13 @@
 import pulumi
 from schema import (
-    EnvType,
     FullStackDeployment,
+    ResolvedEnvironment,
 )
 import pulumi_datadog as datadog
 
 
-def setup_datadog(config: FullStackDeployment) -> dict:
-    provider = list(filter(lambda x: x.env_type == EnvType.common, config.providers))[
-        0
-    ].provider
-    datadog_provider = provider.datadog
+def setup_datadog(env: ResolvedEnvironment, config: FullStackDeployment) -> dict:
+    datadog_provider = env.provider.datadog
 
     datadog_apps: dict = {
         "site": "datadoghq.eu",
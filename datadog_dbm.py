@@ -0,0 +1,53 @@
+import argparse
+
+# Server settings Database Monitoring needs for query metrics and samples.
+dbm_postgres_settings = {
+    "pg_stat_statements_track": "all",
+    "track_activity_query_size": 4096,
+    "track_io_timing": "on",
+}
+
+
+def dbm_setup_sql(username: str = "datadog", schema: str = "datadog") -> str:
+    """
+    Idempotent SQL granting the monitoring user what the agent needs and
+    creating the function it calls to collect explain plans. Run against every
+    database the agent monitors.
+    """
+    return f"""
+CREATE SCHEMA IF NOT EXISTS {schema};
+GRANT USAGE ON SCHEMA {schema} TO {username};
+GRANT USAGE ON SCHEMA public TO {username};
+GRANT pg_monitor TO {username};
+CREATE EXTENSION IF NOT EXISTS pg_stat_statements SCHEMA public;
+
+CREATE OR REPLACE FUNCTION {schema}.explain_statement(
+   l_query TEXT,
+   OUT explain JSON
+)
+RETURNS SETOF JSON AS
+$$
+DECLARE
+curs REFCURSOR;
+plan JSON;
+
+BEGIN
+   OPEN curs FOR EXECUTE pg_catalog.concat('EXPLAIN (FORMAT JSON) ', l_query);
+   FETCH curs INTO plan;
+   CLOSE curs;
+   RETURN QUERY SELECT plan;
+END;
+$$
+LANGUAGE 'plpgsql'
+RETURNS NULL ON NULL INPUT
+SECURITY DEFINER;
+""".lstrip()
+
+
+if __name__ == "__main__":
+    # Prints the setup SQL, e.g. `python datadog_dbm.py | psql "$DATABASE_URL"`.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--username", default="datadog")
+    parser.add_argument("--schema", default="datadog")
+    args = parser.parse_args()
+    print(dbm_setup_sql(args.username, args.schema))
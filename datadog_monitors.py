@@ -0,0 +1,185 @@
+import json
+
+import pulumi
+from schema import (
+    FullStackDeployment,
+    ResolvedEnvironment,
+)
+from template_engine import render_values
+import pulumi_datadog as datadog
+
+api_service = "rest-api"
+# Trace metrics of the Django REST API and the Node webapp servers.
+api_span = "trace.django.request"
+webapp_span = "trace.web.request"
+
+
+def cache_names(env: ResolvedEnvironment) -> list[str]:
+    return ["default"] + [cache.name for cache in env.instances.caches]
+
+
+def latency_monitors(
+    env: ResolvedEnvironment,
+    title: str,
+    service: str,
+    span: str,
+    p95: float,
+    p99: float,
+) -> list[dict]:
+    scope = f"env:{env.env_type.value},service:{service}"
+    return [
+        {
+            "key": f"{service}-{percentile}-latency",
+            "name": f"{title} {percentile} latency",
+            "query": f"percentile(last_10m):{percentile}:{span}{{{scope}}} "
+            f"> {threshold}",
+            "critical": threshold,
+        }
+        for percentile, threshold in [("p95", p95), ("p99", p99)]
+    ]
+
+
+def monitor_specs(env: ResolvedEnvironment, config: FullStackDeployment) -> list[dict]:
+    """
+    Every performance monitor for the env. Queries are scoped by the env tag
+    the Datadog agent adds to all metrics it reports.
+    """
+    thresholds = env.instances.thresholds
+    env_scope = f"env:{env.env_type.value}"
+
+    specs = latency_monitors(
+        env,
+        "REST API",
+        api_service,
+        api_span,
+        thresholds.api_p95_latency,
+        thresholds.api_p99_latency,
+    )
+    for webapp in config.webapps:
+        specs += latency_monitors(
+            env,
+            webapp.name,
+            webapp.name,
+            webapp_span,
+            thresholds.webapp_p95_latency,
+            thresholds.webapp_p99_latency,
+        )
+
+    for queue in env.instances.celery_queues:
+        scope = f"{env_scope},rabbitmq_queue:{queue.queue}"
+        specs += [
+            {
+                "key": f"queue-{queue.queue}-depth",
+                "name": f"Celery queue {queue.queue} depth",
+                "query": f"avg(last_5m):max:rabbitmq.queue.messages{{{scope}}} "
+                f"> {thresholds.queue_depth_critical}",
+                "critical": thresholds.queue_depth_critical,
+                "warning": thresholds.queue_depth_warning,
+            },
+            # The prometheus plugin has no head message timestamp, a queue that
+            # never drains over the window stands in for message age.
+            {
+                "key": f"queue-{queue.queue}-backlog-age",
+                "name": f"Celery queue {queue.queue} backlog older than "
+                f"{thresholds.queue_backlog_minutes}m",
+                "query": f"min(last_{thresholds.queue_backlog_minutes}m):"
+                f"min:rabbitmq.queue.messages{{{scope}}} > 0",
+                "critical": 0,
+            },
+        ]
+
+    specs.append(
+        {
+            "key": "postgres-connections",
+            "name": "Postgres connection saturation",
+            "query": "avg(last_5m):max:postgresql.percent_usage_connections"
+            f"{{{env_scope}}} > {thresholds.pg_connection_usage}",
+            "critical": thresholds.pg_connection_usage,
+        }
+    )
+
+    for cache in cache_names(env):
+        scope = f"{env_scope},valkey_cluster:{cache}"
+        specs += [
+            {
+                "key": f"valkey-{cache}-evictions",
+                "name": f"Valkey {cache} evictions",
+                "query": f"avg(last_10m):per_second(sum:redis.keys.evicted{{{scope}}}) "
+                f"> {thresholds.valkey_evictions_per_second}",
+                "critical": thresholds.valkey_evictions_per_second,
+            },
+            {
+                "key": f"valkey-{cache}-memory",
+                "name": f"Valkey {cache} memory usage",
+                "query": f"avg(last_10m):max:redis.mem.used{{{scope}}} / "
+                f"max:redis.mem.maxmemory{{{scope}}} "
+                f"> {thresholds.valkey_memory_usage}",
+                "critical": thresholds.valkey_memory_usage,
+            },
+        ]
+
+    specs.append(
+        {
+            "key": "haproxy-queue-time",
+            "name": "HAProxy backend queue time",
+            "query": "avg(last_5m):max:haproxy_backend_queue_time_average_seconds"
+            f"{{{env_scope}}} * 1000 > {thresholds.haproxy_queue_time_ms}",
+            "critical": thresholds.haproxy_queue_time_ms,
+        }
+    )
+    return specs
+
+
+def dashboard_definition(env: ResolvedEnvironment, config: FullStackDeployment) -> str:
+    return json.dumps(
+        render_values(
+            "dashboard.yaml",
+            env=env.env_type.value,
+            project_name=config.project_name,
+            api_service=api_service,
+            api_span=api_span,
+            webapp_span=webapp_span,
+            webapps=[webapp.name for webapp in config.webapps],
+            queues=[queue.queue for queue in env.instances.celery_queues],
+            caches=cache_names(env),
+        ),
+        sort_keys=True,
+    )
+
+
+def setup_datadog_monitors(
+    env: ResolvedEnvironment, config: FullStackDeployment
+) -> dict:
+    thresholds = env.instances.thresholds
+    tags = [
+        f"env:{env.env_type.value}",
+        f"project:{config.project_name}",
+        "managed-by:pulumi",
+    ]
+
+    monitors: dict = {}
+    for spec in monitor_specs(env, config):
+        monitor = datadog.Monitor(
+            resource_name=env.resource_prefix + "monitor-" + spec["key"],
+            name=f"[{env.env_type.value}] {spec['name']}",
+            type="query alert",
+            query=spec["query"],
+            message=f"{spec['name']} is above its threshold on "
+            f"{env.env_type.value}. {thresholds.notify}".strip(),
+            monitor_thresholds={
+                "critical": spec["critical"],
+                "warning": spec.get("warning"),
+            },
+            require_full_window=False,
+            tags=tags,
+        )
+        monitors[spec["key"]] = monitor.id
+
+    dashboard = datadog.DashboardJson(
+        resource_name=env.resource_prefix + "performance-dashboard",
+        dashboard=dashboard_definition(env, config),
+    )
+
+    details = {"monitors": monitors, "dashboard_url": dashboard.url}
+    pulumi.export("datadog_monitors", details)
+    return details
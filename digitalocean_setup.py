@@ -1,31 +1,74 @@
 import pulumi
+from cluster_readiness import ClusterReadiness
+from database_tuning import (
+    postgres_profiles,
+    size_resources,
+    tuning_values,
+    valkey_profiles,
+)
+from datadog_dbm import dbm_postgres_settings
+from invokes import Lookups
 from schema import (
     EnvType,
     FullStackDeployment,
+    InstancesType,
+    PoolMode,
+    ResolvedEnvironment,
 )
 import pulumi_digitalocean as digitalocean
 import pulumi_kubernetes as k8s
 import pulumi_random as random
-import pulumiverse_time as time
+
+
+def postgres_connection_limit(db_size: str) -> int:
+    # DigitalOcean allows 25 connections per GiB of RAM, 3 are reserved.
+    _, memory_gb = size_resources(db_size)
+    return memory_gb * 25 - 3
+
+
+def plan_connection_pools(instance_config: InstancesType) -> dict[str, dict]:
+    if not instance_config.pg_workloads:
+        pools = {
+            "default": {
+                "size": instance_config.pg_pool_size,
+                "mode": PoolMode.transaction,
+            }
+        }
+    else:
+        pools = {
+            workload.name: {
+                "size": workload.replicas
+                * workload.processes_per_replica
+                * workload.connections_per_process,
+                "mode": workload.mode,
+            }
+            for workload in instance_config.pg_workloads
+        }
+
+    limit = postgres_connection_limit(instance_config.db_size)
+    total = sum(pool["size"] for pool in pools.values())
+    if total > limit:
+        sizes = ", ".join(f"{name}={pool['size']}" for name, pool in pools.items())
+        raise ValueError(
+            f"Connection pools need {total} connections ({sizes}) but "
+            f"{instance_config.db_size} allows {limit}"
+        )
+    return pools
 
 
 class DigitalOceanSetup:
-    def __init__(self, env_type: EnvType, config: FullStackDeployment) -> None:
-        if env_type not in [EnvType.dev, EnvType.staging, EnvType.prod]:
+    def __init__(
+        self, env: ResolvedEnvironment, config: FullStackDeployment, lookups: Lookups
+    ) -> None:
+        if env.env_type not in [EnvType.dev, EnvType.staging, EnvType.prod]:
             raise ValueError("Invalid environment type")
 
-        self.env_type = env_type
+        self.env_type = env.env_type
         self.config = config
-        self.resource_prefix = f"{env_type.value}-{config.project_name}-"
-
-        self.instance_config = list(
-            filter(lambda x: x.env_type == env_type, config.instances)
-        )[0].instances
-
-        provider = list(
-            filter(lambda x: x.env_type == self.env_type, config.providers)
-        )[0].provider
-        self.digitalocean_provider = provider.digitalocean
+        self.resource_prefix = env.resource_prefix
+        self.instance_config = env.instances
+        self.digitalocean_provider = env.provider.digitalocean
+        self.lookups = lookups
 
     def setup_vpc(self) -> None:
         do_vpc = digitalocean.Vpc(
@@ -102,13 +145,20 @@ class DigitalOceanSetup:
         pulumi.export("cdn", cdn_details)
         return cdn_details
 
-    def setup_redis(self) -> dict:
-        redis_db_cluster = digitalocean.DatabaseCluster(
-            resource_name=self.resource_prefix + "digitalocean-redis",
+    def setup_valkey_cluster(
+        self,
+        resource_name: str,
+        size: str,
+        node_count: int,
+        tuning_profile: str | None,
+        eviction_policy: str | None = None,
+    ) -> tuple[digitalocean.DatabaseCluster, dict]:
+        valkey_cluster = digitalocean.DatabaseCluster(
+            resource_name=self.resource_prefix + resource_name,
             engine="valkey",
             version="8",
-            size=self.instance_config.caching_size,
-            node_count=self.instance_config.caching_node_count,
+            size=size,
+            node_count=node_count,
             region=self.instance_config.default_region,
             private_network_uuid=self.do_vpc.id,
             tags=[self.env_type],
@@ -120,28 +170,66 @@ class DigitalOceanSetup:
             ],
         )
 
-        self.redis_db_cluster = redis_db_cluster
-
-        redis_url = pulumi.Output.all(
-            redis_db_cluster.password,
-            redis_db_cluster.private_host,
-            redis_db_cluster.port,
+        valkey_url = pulumi.Output.all(
+            valkey_cluster.password,
+            valkey_cluster.private_host,
+            valkey_cluster.port,
         ).apply(
             lambda args: f"rediss://default:{args[0]}@{args[1]}:{args[2]}?ssl_cert_reqs=CERT_REQUIRED"
         )
 
-        redis_details = {
-            "host": redis_db_cluster.private_host,
-            "port": redis_db_cluster.port,
-            "password": redis_db_cluster.password,
-            "username": redis_db_cluster.user,
-            "version": redis_db_cluster.version,
-            "url": redis_url,
+        tuning: dict = {}
+        if tuning_profile:
+            tuning = tuning_values(valkey_profiles, tuning_profile, size)
+        if eviction_policy:
+            tuning["valkey_maxmemory_policy"] = eviction_policy
+        if tuning:
+            digitalocean.DatabaseValkeyConfig(
+                resource_name=self.resource_prefix + resource_name + "-config",
+                cluster_id=valkey_cluster.id,
+                **tuning,
+            )
+
+        return valkey_cluster, {
+            "host": valkey_cluster.private_host,
+            "port": valkey_cluster.port,
+            "password": valkey_cluster.password,
+            "username": valkey_cluster.user,
+            "version": valkey_cluster.version,
+            "url": valkey_url,
+            "tuning": tuning,
         }
 
+    def setup_redis(self) -> dict:
+        self.redis_db_cluster, redis_details = self.setup_valkey_cluster(
+            "digitalocean-redis",
+            self.instance_config.caching_size,
+            self.instance_config.caching_node_count,
+            self.instance_config.caching_tuning_profile,
+        )
+
         pulumi.export("redis", redis_details)
         return redis_details
 
+    def setup_valkey(self) -> dict:
+        self.valkey_clusters: dict[str, digitalocean.DatabaseCluster] = {}
+        valkey_details: dict = {}
+
+        for cache in self.instance_config.caches:
+            (
+                self.valkey_clusters[cache.name],
+                valkey_details[cache.name],
+            ) = self.setup_valkey_cluster(
+                f"digitalocean-valkey-{cache.name}",
+                cache.size,
+                cache.node_count,
+                cache.tuning_profile,
+                cache.eviction_policy,
+            )
+
+        pulumi.export("valkey", valkey_details)
+        return valkey_details
+
     def setup_postgres(self) -> dict:
         postgres_db_cluster = digitalocean.DatabaseCluster(
             resource_name=self.resource_prefix + "digitalocean-postgres",
@@ -168,15 +256,55 @@ class DigitalOceanSetup:
             name="main",
         )
 
-        pg_db_connection_pool = digitalocean.DatabaseConnectionPool(
-            resource_name=self.resource_prefix + "digitalocean-db-connection-pool",
-            name=self.resource_prefix + "db-connection-pool",
-            db_name=pg_db.name,
-            cluster_id=postgres_db_cluster.id,
-            mode="transaction",
-            size=self.instance_config.pg_pool_size,
-            user=postgres_db_cluster.user,
-        )
+        connection_pools: dict = {}
+        for name, pool in plan_connection_pools(self.instance_config).items():
+            suffix = "" if name == "default" else f"-{name}"
+            connection_pool = digitalocean.DatabaseConnectionPool(
+                resource_name=self.resource_prefix
+                + f"digitalocean-db-connection-pool{suffix}",
+                name=self.resource_prefix + f"db-connection-pool{suffix}",
+                db_name=pg_db.name,
+                cluster_id=postgres_db_cluster.id,
+                mode=pool["mode"].value,
+                size=pool["size"],
+                user=postgres_db_cluster.user,
+            )
+            connection_pools[name] = {
+                "host": connection_pool.host,
+                "username": connection_pool.user,
+                "password": connection_pool.password,
+                "port": connection_pool.port,
+                "database": connection_pool.name,
+                "version": postgres_db_cluster.version,
+                "mode": pool["mode"].value,
+                "size": pool["size"],
+            }
+
+        replicas = self.setup_postgres_replicas(pg_db)
+
+        tuning: dict = {}
+        if self.instance_config.pg_tuning_profile:
+            tuning = tuning_values(
+                postgres_profiles,
+                self.instance_config.pg_tuning_profile,
+                self.instance_config.db_size,
+            )
+
+        datadog_user = None
+        if self.instance_config.datadog.database_monitoring:
+            tuning = {**tuning, **dbm_postgres_settings}
+            datadog_user = digitalocean.DatabaseUser(
+                resource_name=self.resource_prefix + "digitalocean-postgres-datadog",
+                cluster_id=postgres_db_cluster.id,
+                name="datadog",
+            )
+
+        if tuning:
+            digitalocean.DatabasePostgresqlConfig(
+                resource_name=self.resource_prefix + "digitalocean-postgres-config",
+                cluster_id=postgres_db_cluster.id,
+                **tuning,
+            )
 
         pg_details = {
             "db": {
@@ -187,19 +315,72 @@ class DigitalOceanSetup:
                 "database": pg_db.name,
                 "version": postgres_db_cluster.version,
             },
-            "connection_pool": {
-                "host": pg_db_connection_pool.host,
-                "username": pg_db_connection_pool.user,
-                "password": pg_db_connection_pool.password,
-                "port": pg_db_connection_pool.port,
-                "database": pg_db_connection_pool.name,
-                "version": postgres_db_cluster.version,
-            },
+            # The first pool stays under the original key for existing consumers.
+            "connection_pool": next(iter(connection_pools.values())),
+            "connection_pools": connection_pools,
+            "replicas": replicas,
+            "tuning": tuning,
         }
+        if datadog_user is not None:
+            pg_details["datadog"] = {
+                "username": datadog_user.name,
+                "password": datadog_user.password,
+            }
 
         pulumi.export("postgres", pg_details)
         return pg_details
 
+    def setup_postgres_replicas(self, pg_db: digitalocean.DatabaseDb) -> dict:
+        self.pg_replicas: list[digitalocean.DatabaseReplica] = []
+        replicas: dict = {}
+
+        for replica in self.instance_config.pg_replicas:
+            region = replica.region or self.instance_config.default_region
+            pg_replica = digitalocean.DatabaseReplica(
+                resource_name=self.resource_prefix
+                + f"digitalocean-postgres-replica-{replica.name}",
+                cluster_id=self.postgres_db_cluster.id,
+                name=self.resource_prefix + f"postgres-replica-{replica.name}",
+                size=replica.size or self.instance_config.db_size,
+                region=region,
+                # VPCs are regional, so replicas in other regions are not attached.
+                private_network_uuid=self.do_vpc.id
+                if region == self.instance_config.default_region
+                else None,
+                tags=[self.env_type],
+            )
+            self.pg_replicas.append(pg_replica)
+
+            replica_pool = digitalocean.DatabaseConnectionPool(
+                resource_name=self.resource_prefix
+                + f"digitalocean-db-replica-connection-pool-{replica.name}",
+                name=self.resource_prefix + f"db-replica-pool-{replica.name}",
+                db_name=pg_db.name,
+                cluster_id=pg_replica.uuid,
+                mode="transaction",
+                size=replica.pool_size,
+                user=self.postgres_db_cluster.user,
+            )
+
+            replicas[replica.name] = {
+                "host": pg_replica.host,
+                "private_host": pg_replica.private_host,
+                "region": region,
+                "username": pg_replica.user,
+                "password": pg_replica.password,
+                "port": pg_replica.port,
+                "database": pg_db.name,
+                "connection_pool": {
+                    "host": replica_pool.host,
+                    "username": replica_pool.user,
+                    "password": replica_pool.password,
+                    "port": replica_pool.port,
+                    "database": replica_pool.name,
+                },
+            }
+
+        return replicas
+
     def setup_docker_registry(self) -> dict:
         self.docker_registry = digitalocean.ContainerRegistry(
             resource_name=self.resource_prefix + "digitalocean-docker-registry",
@@ -238,14 +419,12 @@ class DigitalOceanSetup:
         return registry_details
 
     def setup_k8_cluster(self) -> dict:
-        k8_version = digitalocean.get_kubernetes_versions()
-
         k8_cluster = digitalocean.KubernetesCluster(
             resource_name=self.resource_prefix + "digitalocean-k8-cluster",
             region=self.instance_config.default_region,
             name=self.resource_prefix + "k8-cluster",
             vpc_uuid=self.do_vpc.id,
-            version=k8_version.latest_version,
+            version=self.lookups.kubernetes_latest_version(),
             auto_upgrade=True,
             destroy_all_associated_resources=True,
             registry_integration=True,
@@ -264,21 +443,66 @@ class DigitalOceanSetup:
             },
             opts=pulumi.ResourceOptions(
                 depends_on=[self.docker_registry],
+                # Capacity windows move the node pool bounds on a schedule.
+                ignore_changes=["nodePool.minNodes", "nodePool.maxNodes"]
+                if any(
+                    window.min_nodes is not None or window.max_nodes is not None
+                    for window in self.instance_config.capacity_windows
+                )
+                else None,
             ),
         )
 
         self.k8_cluster = k8_cluster
 
         k8_cluster_details = {
+            "id": k8_cluster.id,
+            "node_pool_id": k8_cluster.node_pool.id,
             "name": k8_cluster.name,
             "region": k8_cluster.region,
             "endpoint": k8_cluster.endpoint,
             "kubeconfig": k8_cluster.kube_configs[0].raw_config,
+            "node_pools": self.setup_k8_node_pools(),
         }
 
         pulumi.export("k8_cluster", k8_cluster_details)
         return k8_cluster_details
 
+    def setup_k8_node_pools(self) -> dict:
+        self.k8_node_pools: dict[str, digitalocean.KubernetesNodePool] = {}
+        node_pools: dict = {}
+
+        for node_pool in self.instance_config.k8_node_pools:
+            pool_name = self.resource_prefix + f"node-pool-{node_pool.name}"
+            self.k8_node_pools[node_pool.name] = digitalocean.KubernetesNodePool(
+                resource_name=self.resource_prefix
+                + f"digitalocean-k8-node-pool-{node_pool.name}",
+                cluster_id=self.k8_cluster.id,
+                name=pool_name,
+                size=node_pool.size,
+                auto_scale=True,
+                min_nodes=node_pool.min_nodes,
+                max_nodes=node_pool.max_nodes,
+                labels=node_pool.labels,
+                taints=[taint.model_dump() for taint in node_pool.taints],
+                tags=[self.env_type],
+            )
+
+            node_pools[node_pool.name] = {
+                "name": pool_name,
+                # DOKS labels every node with its pool name.
+                "node_selector": {
+                    "doks.digitalocean.com/node-pool": pool_name,
+                    **node_pool.labels,
+                },
+                "taints": {
+                    taint.key: f"{taint.value}:{taint.effect}"
+                    for taint in node_pool.taints
+                },
+            }
+
+        return node_pools
+
     def setup_firewalls(self) -> None:
         digitalocean.DatabaseFirewall(
             resource_name=self.resource_prefix + "digitalocean-postgres-firewall",
@@ -292,6 +516,24 @@ class DigitalOceanSetup:
             rules=[{"type": "k8s", "value": self.k8_cluster.id}],
         )
 
+        for name, valkey_cluster in self.valkey_clusters.items():
+            digitalocean.DatabaseFirewall(
+                resource_name=self.resource_prefix
+                + f"digitalocean-valkey-{name}-firewall",
+                cluster_id=valkey_cluster.id,
+                rules=[{"type": "k8s", "value": self.k8_cluster.id}],
+            )
+
+        for pg_replica, replica in zip(
+            self.pg_replicas, self.instance_config.pg_replicas
+        ):
+            digitalocean.DatabaseFirewall(
+                resource_name=self.resource_prefix
+                + f"digitalocean-postgres-replica-firewall-{replica.name}",
+                cluster_id=pg_replica.uuid,
+                rules=[{"type": "k8s", "value": self.k8_cluster.id}],
+            )
+
     def setup_do_project(self) -> None:
         mapped_env = {
             EnvType.dev: "Development",
@@ -308,6 +550,7 @@ class DigitalOceanSetup:
             resources=[
                 self.postgres_db_cluster.cluster_urn,
                 self.redis_db_cluster.cluster_urn,
+                *[cluster.cluster_urn for cluster in self.valkey_clusters.values()],
                 self.k8_cluster.cluster_urn,
                 self.bucket.bucket_urn,
                 self.cdn_bucket.bucket_urn,
@@ -328,18 +571,17 @@ class DigitalOceanSetup:
         cdn = self.setup_cdn()
         db = self.setup_postgres()
         redis = self.setup_redis()
+        valkey = self.setup_valkey()
         docker = self.setup_docker_registry()
         k8 = self.setup_k8_cluster()
         self.setup_firewalls()
         self.setup_do_project()
 
-        k8_node_pool_propagation = time.Sleep(
-            self.resource_prefix + "k8_node_pool",
-            create_duration="300s",
-            destroy_duration="300s",
-            triggers={
-                "kubeconfig": k8.get("kubeconfig"),
-            },
+        k8_cluster_readiness = ClusterReadiness(
+            self.resource_prefix + "k8-cluster-readiness",
+            kubeconfig=k8.get("kubeconfig"),
+            node_count=self.instance_config.k8_min_node_count,
+            timeout_seconds=self.instance_config.k8_ready_timeout_seconds,
         )
 
         return {
@@ -347,12 +589,13 @@ class DigitalOceanSetup:
             "cdn": cdn,
             "postgres": db,
             "redis": redis,
+            "valkey": valkey,
             "docker": docker,
             "k8": k8,
             "django_secret_key": self.setup_django_secret_key(),
             "digitalocean_token": self.digitalocean_provider.token,
         }, k8s.Provider(
             f"{self.env_type.value}-k8s",
-            kubeconfig=k8_node_pool_propagation.triggers["kubeconfig"],
-            delete_unreachable=True
+            kubeconfig=k8_cluster_readiness.kubeconfig,
+            delete_unreachable=True,
         )
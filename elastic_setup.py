@@ -1,30 +1,25 @@
 import pulumi_ec as ec
 import pulumi
-from schema import EnvType, FullStackDeployment
+from invokes import Lookups
+from schema import EnvType, FullStackDeployment, ResolvedEnvironment
 
 
 class ElasticCloudSetup:
-    def __init__(self, env_type: EnvType, config: FullStackDeployment) -> None:
-        if env_type not in [EnvType.dev, EnvType.staging, EnvType.prod]:
+    def __init__(
+        self, env: ResolvedEnvironment, config: FullStackDeployment, lookups: Lookups
+    ) -> None:
+        if env.env_type not in [EnvType.dev, EnvType.staging, EnvType.prod]:
             raise ValueError("Invalid environment type")
 
-        self.env_type = env_type
+        self.env_type = env.env_type
         self.config = config
-        self.resource_prefix = f"{env_type.value}-{config.project_name}-"
-
-        self.instance_config = list(
-            filter(lambda x: x.env_type == env_type, config.instances)
-        )[0].instances
-
-        provider = list(
-            filter(lambda x: x.env_type == self.env_type, config.providers)
-        )[0].provider
-        self.elastic_provider = provider.elastic
+        self.resource_prefix = env.resource_prefix
+        self.instance_config = env.instances
+        self.elastic_provider = env.provider.elastic
+        self.lookups = lookups
 
     def _setup_elastic_cloud(self):
-        latest_version = ec.get_stack(
-            version_regex="latest", region="gcp-europe-west2", lock=False
-        ).version
+        latest_version = self.lookups.ec_stack_version("gcp-europe-west2")
 
         db = ec.Deployment(
             resource_name=f"{self.resource_prefix}elastic-deployment",
@@ -0,0 +1,85 @@
+import ast
+import hashlib
+import json
+from pathlib import Path
+
+from plugins import pinned_plugins
+from pulumi import automation as auto
+from pulumi_create_stack import program_steps, step_runners
+from schema import EnvType, FullStackDeployment
+
+fingerprint_output_name = "deploy_fingerprint"
+program_dir = Path(__file__).parent
+
+
+# Config sections holding one entry per env, only the env's own entries are kept.
+per_env_sections = ["env_vars", "instances", "providers"]
+
+
+def env_config_slice(env: EnvType, config: FullStackDeployment) -> dict:
+    data = config.model_dump(mode="json")
+    for section in per_env_sections:
+        data[section] = [
+            entry for entry in data[section] if entry["env_type"] == env.value
+        ]
+    return {"env_type": env.value, **data}
+
+
+def local_imports(path: Path) -> set[str]:
+    names: set[str] = set()
+    for node in ast.walk(ast.parse(path.read_text())):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split(".")[0])
+    return {name for name in names if (program_dir / f"{name}.py").is_file()}
+
+
+def program_modules(env: EnvType) -> list[str]:
+    """
+    The repo modules the env's Pulumi program loads: the step modules, the
+    vault setup and everything they import from the repo. The CLI and the
+    tooling scripts are left out.
+    """
+    pending = ["pulumi_create_stack", "vault_setup"] + [
+        step_runners[step][0] for step in program_steps[env]
+    ]
+    modules: set[str] = set()
+    while pending:
+        name = pending.pop()
+        if name in modules:
+            continue
+        modules.add(name)
+        pending.extend(local_imports(program_dir / f"{name}.py"))
+    return sorted(modules)
+
+
+def program_source_hashes(env: EnvType) -> dict[str, str]:
+    paths = [program_dir / f"{name}.py" for name in program_modules(env)]
+    paths += sorted(program_dir.glob("templates/**/*"))
+    return {
+        str(path.relative_to(program_dir)): hashlib.sha256(
+            path.read_bytes()
+        ).hexdigest()
+        for path in paths
+        if path.is_file()
+    }
+
+
+def deploy_fingerprint(env: EnvType, config: FullStackDeployment) -> str:
+    payload = {
+        "config": env_config_slice(env, config),
+        "sources": program_source_hashes(env),
+        "plugins": {name: plugin.version for name, plugin in pinned_plugins().items()},
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def deployed_fingerprint(stack: auto.Stack) -> str | None:
+    """
+    The fingerprint is exported as a stack output, so it is only recorded once
+    an update has completed successfully.
+    """
+    output = stack.outputs().get(fingerprint_output_name)
+    return output.value if output else None
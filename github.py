@@ -1,12 +1,15 @@
 import pulumi
+from invokes import Lookups
 from schema import (
-    EnvType,
     FullStackDeployment,
+    ResolvedEnvironment,
 )
 import pulumi_github as github
 
 
-def setup_github(config: FullStackDeployment) -> dict:
+def setup_github(
+    env: ResolvedEnvironment, config: FullStackDeployment, lookups: Lookups
+) -> dict:
     # repo = github.Repository(
     #     name=config.project_name,
     #     resource_name=config.project_name,
@@ -14,23 +17,21 @@ def setup_github(config: FullStackDeployment) -> dict:
     #     auto_init=True,
     # )
 
-    repo = github.get_repository(name=config.project_name)
+    repo = lookups.github_repository(config.project_name)
 
-    service_account_token = list(
-        filter(lambda x: x.env_type == EnvType.common, config.providers)
-    )[0].provider.onepassword.service_account_token
+    service_account_token = env.provider.onepassword.service_account_token
 
     github.ActionsSecret(
         resource_name="op_service_account_token",
-        repository=repo.name,
+        repository=repo["name"],
         plaintext_value=service_account_token,
         secret_name="OP_SERVICE_ACCOUNT_TOKEN",
     )
 
     output = {
-        "repo_name": repo.name,
-        "repo_url": repo.html_url,
-        "repo_id": repo.id,
+        "repo_name": repo["name"],
+        "repo_url": repo["html_url"],
+        "repo_id": repo["id"],
     }
     pulumi.export("github_repo", output)
     return output
@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+from pulumi import Input, Output
+from schema import EnvType, ResolvedEnvironment
+
+cache_path = Path(__file__).parent / ".pulumi-cache" / "invokes.json"
+cache_lock = threading.Lock()
+
+# Seconds a lookup result stays valid on disk, 0 disables disk caching.
+lookup_ttls = {
+    "auth0_connection": 24 * 60 * 60,
+    "github_repository": 60 * 60,
+    "ec_stack_version": 6 * 60 * 60,
+    "kubernetes_latest_version": 6 * 60 * 60,
+}
+
+
+class InvokeCache:
+    def __init__(self, path: Path = cache_path) -> None:
+        self.path = path
+
+    def _read(self) -> dict:
+        if not self.path.exists():
+            return {}
+        try:
+            return json.loads(self.path.read_text())
+        except json.JSONDecodeError:
+            return {}
+
+    def get(self, key: str):
+        with cache_lock:
+            entry = self._read().get(key)
+        if entry is None or entry["expires_at"] < time.time():
+            return None
+        return entry["value"]
+
+    def put(self, key: str, value, ttl: int) -> None:
+        with cache_lock:
+            entries = self._read()
+            entries[key] = {"value": value, "expires_at": time.time() + ttl}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(entries, indent=2, sort_keys=True))
+            os.replace(tmp_path, self.path)
+
+
+class NullCache(InvokeCache):
+    """
+    Cache that never stores anything, for runs that must not touch disk.
+    """
+
+    def get(self, key: str):
+        return None
+
+    def put(self, key: str, value, ttl: int) -> None:
+        pass
+
+
+class Lookups:
+    """
+    Data-source invokes used by the program. Every lookup uses the `_output`
+    form so they run concurrently instead of blocking program evaluation, and
+    non-secret results are cached on disk for `lookup_ttls` seconds so other
+    stacks and later previews skip the round trip.
+    """
+
+    def __init__(
+        self, env: ResolvedEnvironment, cache: InvokeCache | None = None
+    ) -> None:
+        self.env = env
+        self.cache = cache or InvokeCache()
+        self.results: dict[str, Output] = {}
+
+    def _lookup(self, name: str, args: dict, invoke: Callable[[], Output]) -> Output:
+        key = f"{name}:{json.dumps(args, sort_keys=True)}"
+        if key in self.results:
+            return self.results[key]
+
+        ttl = lookup_ttls[name]
+        cached = self.cache.get(key) if ttl else None
+        if cached is not None:
+            result = Output.from_input(cached)
+        elif ttl:
+            result = invoke().apply(lambda value: self._store(key, value, ttl))
+        else:
+            result = invoke()
+
+        self.results[key] = result
+        return result
+
+    def _store(self, key: str, value, ttl: int):
+        self.cache.put(key, value, ttl)
+        return value
+
+    def auth0_connection_id(self, name: str) -> Output[str]:
+        import pulumi_auth0 as auth0
+
+        return self._lookup(
+            "auth0_connection",
+            {"domain": self.env.provider.auth0.domain, "name": name},
+            lambda: auth0.get_connection_output(name=name).id,
+        )
+
+    def auth0_client_secret(self, client_id: Input[str]) -> Output[str]:
+        import pulumi_auth0 as auth0
+
+        return Output.secret(auth0.get_client_output(client_id=client_id).client_secret)
+
+    def github_repository(self, name: str) -> Output[dict]:
+        import pulumi_github as github
+
+        return self._lookup(
+            "github_repository",
+            {"owner": self.env.provider.github.owner, "name": name},
+            lambda: github.get_repository_output(name=name).apply(
+                lambda repo: {
+                    "name": repo.name,
+                    "html_url": repo.html_url,
+                    "id": repo.id,
+                }
+            ),
+        )
+
+    def ec_stack_version(self, region: str) -> Output[str]:
+        import pulumi_ec as ec
+
+        return self._lookup(
+            "ec_stack_version",
+            {"region": region},
+            lambda: ec.get_stack_output(
+                version_regex="latest", region=region, lock=False
+            ).version,
+        )
+
+    def kubernetes_latest_version(self) -> Output[str]:
+        import pulumi_digitalocean as digitalocean
+
+        return self._lookup(
+            "kubernetes_latest_version",
+            {},
+            lambda: digitalocean.get_kubernetes_versions_output().latest_version,
+        )
+
+    def prefetch(self, project_name: str) -> None:
+        """
+        Issues every static lookup the env's program needs up front so they
+        resolve in parallel while resources are being registered.
+        """
+        if self.env.env_type == EnvType.common:
+            self.github_repository(project_name)
+            return
+
+        self.auth0_connection_id("Username-Password-Authentication")
+        self.auth0_connection_id("google-oauth2")
+
+        if self.env.env_type in [EnvType.dev, EnvType.staging, EnvType.prod]:
+            self.ec_stack_version("gcp-europe-west2")
+            self.kubernetes_latest_version()
+
+
+class StaticLookups(Lookups):
+    """
+    Local stand-in returning fixed values, for running the program under
+    Pulumi mocks without any invokes.
+    """
+
+    def __init__(self, env: ResolvedEnvironment) -> None:
+        super().__init__(env, cache=NullCache())
+
+    def auth0_connection_id(self, name: str) -> Output[str]:
+        return Output.from_input(f"con_{name}")
+
+    def auth0_client_secret(self, client_id: Input[str]) -> Output[str]:
+        return Output.secret("client-secret")
+
+    def github_repository(self, name: str) -> Output[dict]:
+        return Output.from_input(
+            {"name": name, "html_url": f"https://github.com/local/{name}", "id": name}
+        )
+
+    def ec_stack_version(self, region: str) -> Output[str]:
+        return Output.from_input("8.17.0")
+
+    def kubernetes_latest_version(self) -> Output[str]:
+        return Output.from_input("1.32.1-do.0")
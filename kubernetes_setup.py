@@ -1,44 +1,119 @@
+import hashlib
 import json
-import jinja2
-import yaml
 import pulumi_kubernetes as k8
 import pulumi
-from schema import EnvType, FullStackDeployment
+from charts import chart_args
+from template_engine import chart_values
+from schema import EnvType, FullStackDeployment, LogPolicy, ResolvedEnvironment
 from pulumi_kubernetes.helm.v4 import Chart
 import pulumi_random as random
-from pulumi_kubernetes.core.v1 import Secret, Namespace
+from datadog_dbm import dbm_setup_sql
+from pulumi_kubernetes.batch.v1 import CronJob, Job
+from pulumi_kubernetes.core.v1 import ConfigMap, Secret, Namespace
 from pulumi_kubernetes.yaml.v2 import ConfigGroup
 from pulumi import Output
 
 
-def create_template(path: str) -> jinja2.Template:
-    with open(path, "r") as f:
-        template = jinja2.Template(f.read())
-    return template
-
-
-datadog_yaml_template_path = "templates/datadog.yaml"
+prometheus_server_address = "http://prometheus-server.default.svc.cluster.local"
+
+
+def scaled_object(
+    name: str,
+    deployment: str,
+    min_replicas: int,
+    max_replicas: int,
+    cooldown_period: int,
+    polling_interval: int,
+    triggers: list[dict],
+) -> dict:
+    return {
+        "apiVersion": "keda.sh/v1alpha1",
+        "kind": "ScaledObject",
+        "metadata": {"name": name, "namespace": "default"},
+        "spec": {
+            "scaleTargetRef": {"name": deployment},
+            "minReplicaCount": min_replicas,
+            "maxReplicaCount": max_replicas,
+            "cooldownPeriod": cooldown_period,
+            "pollingInterval": polling_interval,
+            "triggers": triggers,
+        },
+    }
+
+
+doctl_image = "digitalocean/doctl:1.110.0"
+
+# Services writing JSON logs to /var/logs/<service>/json.log on the node.
+log_services = [
+    "rest-api",
+    "celery-flower",
+    "celery-worker",
+    "celery-scheduler",
+    "collect-static-job",
+    "create-superuser-job",
+    "elastic-migrate-job",
+    "migrate-job",
+    "websocket-service",
+]
+
+
+def log_processing_rules(policy: LogPolicy) -> list[dict]:
+    rules: list[dict] = []
+    if policy.multiline_pattern:
+        rules.append(
+            {
+                "type": "multi_line",
+                "name": "new_record",
+                "pattern": policy.multiline_pattern,
+            }
+        )
+    for index, pattern in enumerate(policy.exclude_patterns):
+        rules.append(
+            {
+                "type": "exclude_at_match",
+                "name": f"exclude_{index}",
+                "pattern": pattern,
+            }
+        )
+    return rules
+
+
+def log_sources(policies: list[LogPolicy]) -> list[dict]:
+    by_service = {policy.service: policy for policy in policies}
+    unknown = set(by_service) - set(log_services)
+    if unknown:
+        raise ValueError(f"Log policies for unknown services: {sorted(unknown)}")
+
+    sources: list[dict] = []
+    for service in log_services:
+        policy = by_service.get(service, LogPolicy(service=service))
+        sources.append(
+            {
+                "service": service,
+                "log_processing_rules": log_processing_rules(policy),
+            }
+        )
+    return sources
 
 
 class KubernetesSetup:
     def __init__(
         self,
-        env_type: EnvType,
+        env: ResolvedEnvironment,
         config: FullStackDeployment,
         k8_provider: k8.Provider,
         secrets: dict,
     ) -> None:
-        if env_type not in [EnvType.dev, EnvType.staging, EnvType.prod]:
+        if env.env_type not in [EnvType.dev, EnvType.staging, EnvType.prod]:
             raise ValueError("Invalid environment type")
 
-        self.env_type = env_type
+        self.env_type = env.env_type
         self.config = config
-        self.resource_prefix = f"{env_type.value}-{config.project_name}-"
+        self.resource_prefix = env.resource_prefix
+        self.instance_config = env.instances
         self.k8_provider = k8_provider
 
-        provider = list(
-            filter(lambda x: x.env_type == self.env_type, config.providers)
-        )[0].provider
+        provider = env.provider
         self.cloudflare_provider = provider.cloudflare
         self.datadog_provider = provider.datadog
         self.onepassword = provider.onepassword
@@ -61,10 +136,7 @@ class KubernetesSetup:
         k8_dash = Chart(
             "kubernetes-dashboard",
             namespace="kubernetes-dashboard",
-            chart="kubernetes-dashboard",
-            repository_opts={
-                "repo": "https://kubernetes.github.io/dashboard/",
-            },
+            **chart_args("kubernetes-dashboard"),
             opts=pulumi.ResourceOptions(
                 provider=self.k8_provider, depends_on=[k8_dash_namespace]
             ),
@@ -127,62 +199,418 @@ class KubernetesSetup:
             ),
         )
 
+    def _setup_celery_scaling(self, keda: Chart, rabbitmq_url: Output[str]):
+        """
+        KEDA only allows one ScaledObject per deployment, so queues consumed by
+        the same worker deployment become triggers of a single ScaledObject.
+        """
+        if not self.instance_config.celery_queues:
+            return
+
+        keda_rabbitmq_secret = Secret(
+            "keda-rabbitmq",
+            type="Opaque",
+            metadata={"name": "keda-rabbitmq"},
+            string_data={"host": rabbitmq_url},
+            opts=pulumi.ResourceOptions(provider=self.k8_provider),
+        )
+
+        trigger_auth = ConfigGroup(
+            "keda-rabbitmq-trigger-auth",
+            objs=[
+                {
+                    "apiVersion": "keda.sh/v1alpha1",
+                    "kind": "TriggerAuthentication",
+                    "metadata": {"name": "keda-rabbitmq", "namespace": "default"},
+                    "spec": {
+                        "secretTargetRef": [
+                            {
+                                "parameter": "host",
+                                "name": "keda-rabbitmq",
+                                "key": "host",
+                            }
+                        ]
+                    },
+                }
+            ],
+            opts=pulumi.ResourceOptions(
+                provider=self.k8_provider, depends_on=[keda, keda_rabbitmq_secret]
+            ),
+        )
+
+        deployments: dict[str, list] = {}
+        for queue in self.instance_config.celery_queues:
+            deployments.setdefault(queue.deployment, []).append(queue)
+
+        ConfigGroup(
+            "celery-scaled-objects",
+            objs=[
+                scaled_object(
+                    name=f"{deployment}-rabbitmq",
+                    deployment=deployment,
+                    min_replicas=max(queue.min_replicas for queue in queues),
+                    max_replicas=max(queue.max_replicas for queue in queues),
+                    cooldown_period=max(queue.cooldown_period for queue in queues),
+                    polling_interval=min(queue.polling_interval for queue in queues),
+                    triggers=[
+                        {
+                            "type": "rabbitmq",
+                            "metadata": {
+                                "protocol": "amqp",
+                                "mode": "QueueLength",
+                                "queueName": queue.queue,
+                                "value": str(queue.target_length),
+                            },
+                            "authenticationRef": {"name": "keda-rabbitmq"},
+                        }
+                        for queue in queues
+                    ]
+                    + [
+                        {
+                            "type": "cron",
+                            "metadata": {
+                                "timezone": window.timezone,
+                                "start": window.start,
+                                "end": window.end,
+                                "desiredReplicas": str(window.worker_min_replicas),
+                            },
+                        }
+                        for window in self.instance_config.capacity_windows
+                        if window.worker_min_replicas is not None
+                    ],
+                )
+                for deployment, queues in deployments.items()
+            ],
+            opts=pulumi.ResourceOptions(
+                provider=self.k8_provider, depends_on=[keda, trigger_auth]
+            ),
+        )
+
+    def _setup_request_scaling(
+        self, keda: Chart, haproxy: Chart, prometheus: Chart
+    ) -> None:
+        """
+        Scales on the metrics HAProxy exposes to Prometheus, see
+        https://www.haproxy.com/blog/autoscaling-with-the-haproxy-kubernetes-ingress-controller-and-keda
+        """
+
+        def prometheus_trigger(query: str, threshold: int, metric_type: str) -> dict:
+            return {
+                "type": "prometheus",
+                "metricType": metric_type,
+                "metadata": {
+                    "serverAddress": prometheus_server_address,
+                    "query": query,
+                    "threshold": str(threshold),
+                },
+            }
+
+        scaled_objects = []
+        if self.instance_config.haproxy_scaling:
+            scaling = self.instance_config.haproxy_scaling
+            scaled_objects.append(
+                scaled_object(
+                    name=f"{scaling.deployment}-requests",
+                    deployment=scaling.deployment,
+                    min_replicas=scaling.min_replicas,
+                    max_replicas=scaling.max_replicas,
+                    cooldown_period=scaling.cooldown_period,
+                    polling_interval=scaling.polling_interval,
+                    triggers=[
+                        prometheus_trigger(
+                            "sum(rate(haproxy_frontend_http_requests_total[2m]))",
+                            scaling.requests_per_second,
+                            "AverageValue",
+                        ),
+                        prometheus_trigger(
+                            "max(haproxy_backend_queue_time_average_seconds) * 1000",
+                            scaling.queue_time_ms,
+                            "Value",
+                        ),
+                    ],
+                )
+            )
+
+        if self.instance_config.rest_api_scaling:
+            scaling = self.instance_config.rest_api_scaling
+            backend = scaling.backend or f".*{scaling.deployment}.*"
+            scaled_objects.append(
+                scaled_object(
+                    name=f"{scaling.deployment}-requests",
+                    deployment=scaling.deployment,
+                    min_replicas=scaling.min_replicas,
+                    max_replicas=scaling.max_replicas,
+                    cooldown_period=scaling.cooldown_period,
+                    polling_interval=scaling.polling_interval,
+                    triggers=[
+                        prometheus_trigger(
+                            "sum(rate(haproxy_backend_http_requests_total"
+                            f'{{proxy=~"{backend}"}}[2m]))',
+                            scaling.requests_per_second,
+                            "AverageValue",
+                        ),
+                        prometheus_trigger(
+                            "max(haproxy_backend_queue_time_average_seconds"
+                            f'{{proxy=~"{backend}"}}) * 1000',
+                            scaling.queue_time_ms,
+                            "Value",
+                        ),
+                    ],
+                )
+            )
+
+        if not scaled_objects:
+            return
+
+        ConfigGroup(
+            "request-rate-scaled-objects",
+            objs=scaled_objects,
+            opts=pulumi.ResourceOptions(
+                provider=self.k8_provider, depends_on=[keda, haproxy, prometheus]
+            ),
+        )
+
+    def _setup_datadog_dbm(self) -> None:
+        """
+        Grants the Datadog monitoring user and creates the explain function with
+        a psql Job, the database is only reachable from inside the cluster.
+        """
+        postgres = self.secrets.get("digitalocean").get("postgres")
+        db = postgres.get("db")
+
+        setup_sql = postgres.get("datadog").get("username").apply(dbm_setup_sql)
+
+        sql = ConfigMap(
+            "datadog-dbm-setup-sql",
+            metadata={"name": "datadog-dbm-setup-sql"},
+            data={"setup.sql": setup_sql},
+            opts=pulumi.ResourceOptions(provider=self.k8_provider),
+        )
+        connection = Secret(
+            "datadog-dbm-setup",
+            type="Opaque",
+            metadata={"name": "datadog-dbm-setup"},
+            string_data={
+                "PGHOST": db.get("host"),
+                "PGPORT": pulumi.Output.from_input(db.get("port")).apply(str),
+                "PGUSER": db.get("username"),
+                "PGPASSWORD": db.get("password"),
+                "PGDATABASE": db.get("database"),
+                "PGSSLMODE": "require",
+            },
+            opts=pulumi.ResourceOptions(provider=self.k8_provider),
+        )
+
+        # The SQL checksum is part of the immutable pod template, so changed SQL
+        # replaces the Job and it runs again.
+        Job(
+            "datadog-dbm-setup",
+            spec={
+                "backoff_limit": 4,
+                "template": {
+                    "metadata": {
+                        "annotations": {
+                            "checksum/sql": setup_sql.apply(
+                                lambda text: hashlib.sha256(text.encode()).hexdigest()
+                            )
+                        }
+                    },
+                    "spec": {
+                        "restart_policy": "OnFailure",
+                        "containers": [
+                            {
+                                "name": "psql",
+                                "image": "postgres:16-alpine",
+                                "command": [
+                                    "psql",
+                                    "-v",
+                                    "ON_ERROR_STOP=1",
+                                    "-f",
+                                    "/sql/setup.sql",
+                                ],
+                                "env_from": [
+                                    {"secret_ref": {"name": "datadog-dbm-setup"}}
+                                ],
+                                "volume_mounts": [
+                                    {"name": "sql", "mount_path": "/sql"}
+                                ],
+                            }
+                        ],
+                        "volumes": [
+                            {
+                                "name": "sql",
+                                "config_map": {"name": "datadog-dbm-setup-sql"},
+                            }
+                        ],
+                    },
+                },
+            },
+            opts=pulumi.ResourceOptions(
+                provider=self.k8_provider,
+                depends_on=[sql, connection],
+                replace_on_changes=["spec"],
+            ),
+        )
+
+    def _setup_apm_settings(self, dbm_enabled: bool) -> None:
+        """
+        ddtrace settings for the Python services. The ConfigMap is published
+        for the app chart to consume, nothing in this repo references it.
+        """
+        datadog = self.instance_config.datadog
+        ConfigMap(
+            "datadog-apm",
+            metadata={"name": "datadog-apm"},
+            data={
+                "DD_ENV": self.env_type.value,
+                "DD_TRACE_ENABLED": str(datadog.apm_enabled).lower(),
+                "DD_TRACE_SAMPLE_RATE": str(datadog.trace_sample_rate),
+                "DD_PROFILING_ENABLED": str(datadog.profiling_enabled).lower(),
+                "DD_RUNTIME_METRICS_ENABLED": "true",
+                "DD_LOGS_INJECTION": "true",
+                "DD_CELERY_DISTRIBUTED_TRACING": "true",
+                # Links APM spans to the DBM query samples they issued.
+                "DD_DBM_PROPAGATION_MODE": "full" if dbm_enabled else "disabled",
+            },
+            opts=pulumi.ResourceOptions(provider=self.k8_provider),
+        )
+
+    def _setup_capacity_schedules(self) -> None:
+        """
+        DOKS has no scheduled autoscaling, so a CronJob per window edge updates
+        the default node pool bounds with doctl, restoring the configured
+        k8_min_node_count/k8_max_node_count when the window closes.
+        """
+        windows = [
+            window
+            for window in self.instance_config.capacity_windows
+            if window.min_nodes is not None or window.max_nodes is not None
+        ]
+        if not windows:
+            return
+
+        digitalocean_secrets = self.secrets.get("digitalocean")
+        token_secret = Secret(
+            "node-pool-scheduler-token",
+            type="Opaque",
+            metadata={"name": "node-pool-scheduler-token"},
+            string_data={"token": digitalocean_secrets.get("digitalocean_token")},
+            opts=pulumi.ResourceOptions(provider=self.k8_provider),
+        )
+
+        cluster_id = digitalocean_secrets.get("k8").get("id")
+        node_pool_id = digitalocean_secrets.get("k8").get("node_pool_id")
+
+        for window in windows:
+            edges = {
+                "start": (
+                    window.start,
+                    window.min_nodes
+                    if window.min_nodes is not None
+                    else self.instance_config.k8_min_node_count,
+                    window.max_nodes
+                    if window.max_nodes is not None
+                    else self.instance_config.k8_max_node_count,
+                ),
+                "end": (
+                    window.end,
+                    self.instance_config.k8_min_node_count,
+                    self.instance_config.k8_max_node_count,
+                ),
+            }
+            for edge, (schedule, min_nodes, max_nodes) in edges.items():
+                name = f"node-pool-{window.name}-{edge}"
+                CronJob(
+                    name,
+                    metadata={"name": name},
+                    spec={
+                        "schedule": schedule,
+                        "time_zone": window.timezone,
+                        "concurrency_policy": "Replace",
+                        "job_template": {
+                            "spec": {
+                                "backoff_limit": 3,
+                                "template": {
+                                    "spec": {
+                                        "restart_policy": "OnFailure",
+                                        "containers": [
+                                            {
+                                                "name": "doctl",
+                                                "image": doctl_image,
+                                                "args": [
+                                                    "kubernetes",
+                                                    "cluster",
+                                                    "node-pool",
+                                                    "update",
+                                                    cluster_id,
+                                                    node_pool_id,
+                                                    "--auto-scale",
+                                                    f"--min-nodes={min_nodes}",
+                                                    f"--max-nodes={max_nodes}",
+                                                ],
+                                                "env": [
+                                                    {
+                                                        "name": "DIGITALOCEAN_ACCESS_TOKEN",
+                                                        "value_from": {
+                                                            "secret_key_ref": {
+                                                                "name": "node-pool-scheduler-token",
+                                                                "key": "token",
+                                                            }
+                                                        },
+                                                    }
+                                                ],
+                                            }
+                                        ],
+                                    }
+                                },
+                            }
+                        },
+                    },
+                    opts=pulumi.ResourceOptions(
+                        provider=self.k8_provider, depends_on=[token_secret]
+                    ),
+                )
+
     def setup(self):
         self._setup_k8_dashboard()
-        Chart(
+        keda = Chart(
             "kedacore",
             namespace="default",
-            chart="keda",
-            repository_opts={
-                "repo": "https://kedacore.github.io/charts",
-            },
+            **chart_args("keda"),
             opts=pulumi.ResourceOptions(provider=self.k8_provider, depends_on=[]),
         )
 
         Chart(
             "metrics-server",
             namespace="default",
-            chart="metrics-server",
-            repository_opts={
-                "repo": "https://kubernetes-sigs.github.io/metrics-server",
-            },
+            **chart_args("metrics-server"),
             opts=pulumi.ResourceOptions(provider=self.k8_provider, depends_on=[]),
         )
 
         Chart(
             "kube-state-metrics",
             namespace="default",
-            chart="kube-state-metrics",
-            repository_opts={
-                "repo": "https://prometheus-community.github.io/helm-charts",
-            },
+            **chart_args("kube-state-metrics"),
             opts=pulumi.ResourceOptions(provider=self.k8_provider, depends_on=[]),
         )
 
         cert_manager = Chart(
             "cert-manager",
             namespace="default",
-            chart="cert-manager",
-            repository_opts={
-                "repo": "https://charts.jetstack.io",
-            },
-            values={"installCRDs": True},
+            **chart_args("cert-manager"),
+            values=chart_values("cert-manager"),
             opts=pulumi.ResourceOptions(provider=self.k8_provider, depends_on=[]),
         )
 
         Chart(
             "external-dns",
             namespace="default",
-            chart="oci://registry-1.docker.io/bitnamicharts/external-dns",
-            values={
-                "provider": "cloudflare",
-                "cloudflare": {
-                    "apiToken": self.cloudflare_provider.token,
-                    "proxied": True,
-                },
-                "domainFilters": [self.config.main_domain],
-                "txtOwnerId": "external-dns",
-            },
+            **chart_args("external-dns"),
+            values=chart_values(
+                "external-dns",
+                api_token=pulumi.Output.secret(self.cloudflare_provider.token),
+                main_domain=self.config.main_domain,
+            ),
             opts=pulumi.ResourceOptions(provider=self.k8_provider, depends_on=[]),
         )
 
@@ -193,27 +621,15 @@ class KubernetesSetup:
         Chart(
             "rabbitmq",
             namespace="default",
-            chart="oci://registry-1.docker.io/bitnamicharts/rabbitmq",
+            **chart_args("rabbitmq"),
             opts=pulumi.ResourceOptions(provider=self.k8_provider, depends_on=[]),
-            values={
-                "auth": {"username": "main_user", "password": rabbitmq_password},
-                "extraConfiguration": """
-                    default_vhost = myvhost
-                    default_permissions.configure = .*
-                    default_permissions.read = .*
-                    default_permissions.write = .*
-                """,
-                "metrics": {"enabled": True},
-            },
+            values=chart_values("rabbitmq", password=rabbitmq_password),
         )
 
         Chart(
             "onepassword",
             namespace="default",
-            chart="connect",
-            repository_opts={
-                "repo": "https://1password.github.io/connect-helm-charts",
-            },
+            **chart_args("connect"),
             opts=pulumi.ResourceOptions(provider=self.k8_provider, depends_on=[]),
             values={
                 "connect": {
@@ -231,33 +647,18 @@ class KubernetesSetup:
         )
 
         # https://www.haproxy.com/blog/autoscaling-with-the-haproxy-kubernetes-ingress-controller-and-keda
-        Chart(
+        haproxy = Chart(
             "kubernetes-ingress-haproxy",
             namespace="default",
-            chart="kubernetes-ingress",
-            repository_opts={"repo": "https://haproxytech.github.io/helm-charts"},
+            **chart_args("kubernetes-ingress"),
             opts=pulumi.ResourceOptions(provider=self.k8_provider, depends_on=[]),
-            values={
-                "controller": {
-                    "podAnnotations": {
-                        "prometheus.io/scrape": "true",
-                        "prometheus.io/port": "1024",
-                        "prometheus.io/path": "/metrics",
-                    },
-                    "service": {
-                        "type": "LoadBalancer",
-                    },
-                }
-            },
+            values=chart_values("kubernetes-ingress"),
         )
 
-        Chart(
+        prometheus = Chart(
             "prometheus",
             namespace="default",
-            chart="prometheus",
-            repository_opts={
-                "repo": "https://prometheus-community.github.io/helm-charts"
-            },
+            **chart_args("prometheus"),
             opts=pulumi.ResourceOptions(provider=self.k8_provider, depends_on=[]),
         )
 
@@ -335,11 +736,31 @@ class KubernetesSetup:
             ),
         )
 
-        redis_host = self.secrets.get("digitalocean").get("redis").get("host")
-        redis_port = self.secrets.get("digitalocean").get("redis").get("port")
-        redis_password = self.secrets.get("digitalocean").get("redis").get("password")
-        redis_username = self.secrets.get("digitalocean").get("redis").get("username")
-        redis_url = self.secrets.get("digitalocean").get("redis").get("url")
+        valkey_clusters = {
+            "default": self.secrets.get("digitalocean").get("redis"),
+            **self.secrets.get("digitalocean").get("valkey", {}),
+        }
+        redis_instances = [
+            {
+                "name": name,
+                "host": cluster.get("host"),
+                "port": cluster.get("port"),
+                "password": cluster.get("password"),
+                "username": cluster.get("username"),
+            }
+            for name, cluster in valkey_clusters.items()
+        ]
+
+        dbm_enabled = (
+            "datadog" in self.secrets.get("digitalocean").get("postgres")
+            and self.instance_config.datadog.database_monitoring
+        )
+        # With DBM the agent connects as the dedicated monitoring user.
+        postgres_monitor = (
+            self.secrets.get("digitalocean")
+            .get("postgres")
+            .get("datadog" if dbm_enabled else "db")
+        )
 
         postgres_host = (
             self.secrets.get("digitalocean").get("postgres").get("db").get("host")
@@ -347,12 +768,8 @@ class KubernetesSetup:
         postgres_port = (
             self.secrets.get("digitalocean").get("postgres").get("db").get("port")
         )
-        postgres_password = (
-            self.secrets.get("digitalocean").get("postgres").get("db").get("password")
-        )
-        postgres_username = (
-            self.secrets.get("digitalocean").get("postgres").get("db").get("username")
-        )
+        postgres_password = postgres_monitor.get("password")
+        postgres_username = postgres_monitor.get("username")
         postgres_dbname = (
             self.secrets.get("digitalocean").get("postgres").get("db").get("database")
         )
@@ -361,12 +778,17 @@ class KubernetesSetup:
         elasticsearch_username = self.secrets.get("elastic").get("username")
         elasticsearch_password = self.secrets.get("elastic").get("password")
 
-        datadog_yaml = pulumi.Output.all(
-            redis_host=redis_host,
-            redis_port=redis_port,
-            redis_password=redis_password,
-            redis_url=redis_url,
-            redis_user=redis_username,
+        sources = log_sources(self.instance_config.log_policies)
+
+        datadog_yaml = chart_values(
+            "datadog",
+            log_sources=sources,
+            log_max_message_bytes=self.instance_config.log_max_message_bytes,
+            api_key=pulumi.Output.secret(self.datadog_provider.api_key),
+            rabbitmq_host="rabbitmq",
+            env=self.env_type.value,
+            postgres_dbm=dbm_enabled,
+            redis_instances=redis_instances,
             postgres_host=postgres_host,
             postgres_port=postgres_port,
             postgres_password=postgres_password,
@@ -375,37 +797,12 @@ class KubernetesSetup:
             elasticsearch_host=elasticsearch_host,
             elasticsearch_username=elasticsearch_username,
             elasticsearch_password=elasticsearch_password,
-        ).apply(
-            lambda args: yaml.safe_load(
-                create_template(datadog_yaml_template_path)
-                .render(
-                    api_key=self.datadog_provider.api_key,
-                    redis_host=args["redis_host"],
-                    redis_port=args["redis_port"],
-                    redis_password=args["redis_password"],
-                    redis_user=args["redis_user"],
-                    redis_url=args["redis_url"],
-                    postgres_host=args["postgres_host"],
-                    postgres_port=args["postgres_port"],
-                    postgres_password=args["postgres_password"],
-                    postgres_username=args["postgres_username"],
-                    postgres_dbname=args["postgres_dbname"],
-                    elasticsearch_host=args["elasticsearch_host"],
-                    elasticsearch_username=args["elasticsearch_username"],
-                    elasticsearch_password=args["elasticsearch_password"],
-                    rabbitmq_host="rabbitmq",
-                )
-                .encode("utf-8")
-            )
         )
 
         Chart(
             resource_name="datadog-agent",
             namespace="default",
-            chart="datadog",
-            repository_opts={
-                "repo": "https://helm.datadoghq.com",
-            },
+            **chart_args("datadog"),
             opts=pulumi.ResourceOptions(
                 provider=self.k8_provider, depends_on=[], ignore_changes=[]
             ),
@@ -436,6 +833,13 @@ class KubernetesSetup:
             ),
         )
 
+        self._setup_celery_scaling(keda, formatted_rabbitmq_url)
+        self._setup_request_scaling(keda, haproxy, prometheus)
+        self._setup_capacity_schedules()
+        if dbm_enabled:
+            self._setup_datadog_dbm()
+        self._setup_apm_settings(dbm_enabled)
+
         return {
             "rabbitmq": {
                 "password": rabbitmq_password,
@@ -1,3 +1,16 @@
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable
+
+from charts import populate_chart_cache
+from fingerprint import (
+    deploy_fingerprint,
+    deployed_fingerprint,
+    fingerprint_output_name,
+)
+from plugins import install_plugins
+from profiler import DeploymentProfiler
 from providers import get_common_provider, get_dev_provider, get_local_provider
 from pulumi_create_stack import create_pulumi_program
 from schema import (
@@ -6,93 +19,188 @@ from schema import (
     EnvType,
     FullStackDeployment,
     InstancesType,
+    ResolvedEnvironment,
     Webapp,
     WebappAuthType,
+    resolve_environment,
+    resolve_environments,
 )
+from stack_config import sync_stack_config
+import pulumi
 from pulumi import automation as auto
 
 
 def build_stack(
-    env: EnvType,
+    resolved: ResolvedEnvironment,
     config: FullStackDeployment,
+    fingerprint: str | None = None,
 ):
     def pulumi_program():
-        return create_pulumi_program(env, config)
+        if fingerprint:
+            pulumi.export(fingerprint_output_name, fingerprint)
+        return create_pulumi_program(resolved, config)
 
-    stack_name = f"{config.project_name}-{env.value}"
-    provider = list(filter(lambda x: x.env_type == env, config.providers))[0].provider
+    stack_name = f"{config.project_name}-{resolved.env_type.value}"
+    # Dynamic providers are unpickled in a separate plugin process, which needs
+    # the program modules on its import path.
+    program_dir = os.path.dirname(os.path.abspath(__file__))
+    python_path = os.pathsep.join(
+        filter(None, [program_dir, os.environ.get("PYTHONPATH")])
+    )
     stack = auto.create_or_select_stack(
         stack_name=stack_name,
         project_name=config.project_name,
         program=pulumi_program,
+        opts=auto.LocalWorkspaceOptions(env_vars={"PYTHONPATH": python_path}),
     )
 
-    stack.set_config(
-        "digitalocean:token", auto.ConfigValue(provider.digitalocean.token)
-    )
-    stack.set_config(
-        "digitalocean:spacesAccessId",
-        auto.ConfigValue(provider.digitalocean.spaces_access_id),
-    )
-    stack.set_config(
-        "digitalocean:spacesSecretKey",
-        auto.ConfigValue(provider.digitalocean.spaces_secret_key),
-    )
+    sync_stack_config(stack, resolved.provider)
 
-    stack.set_config("ec:apikey", auto.ConfigValue(provider.elastic.api_key))
+    return stack
 
-    stack.set_config("auth0:clientId", auto.ConfigValue(provider.auth0.client_id))
-    stack.set_config(
-        "auth0:clientSecret", auto.ConfigValue(provider.auth0.client_secret)
-    )
-    stack.set_config("auth0:domain", auto.ConfigValue(provider.auth0.domain))
 
-    stack.set_config("github:token", auto.ConfigValue(provider.github.token))
-    stack.set_config("github:owner", auto.ConfigValue(provider.github.owner))
+def prefixed_output(env: EnvType) -> Callable[[str], None]:
+    def on_output(line: str) -> None:
+        print(f"[{env.value}] {line}", flush=True)
 
-    stack.set_config("cloudflare:apiToken", auto.ConfigValue(provider.cloudflare.token))
+    return on_output
 
-    stack.set_config("datadog:apiKey", auto.ConfigValue(provider.datadog.api_key))
-    stack.set_config("datadog:apiUrl", auto.ConfigValue(provider.datadog.api_url))
-    stack.set_config("datadog:appKey", auto.ConfigValue(provider.datadog.app_key))
 
-    stack.set_config(
-        "onepassword:serviceAccountToken",
-        auto.ConfigValue(provider.onepassword.service_account_token),
-    )
+def create_stack(
+    resolved: ResolvedEnvironment,
+    config: FullStackDeployment,
+    on_output: Callable[[str], None] = print,
+    force: bool = False,
+    unchanged: str = "skip",
+    profile: bool = False,
+    dogstatsd: bool = False,
+) -> dict:
+    """
+    Skips the refresh + up when the env's config slice, program sources and
+    pinned versions match the fingerprint of the last successful deploy.
+    With unchanged="preview" a fast preview is run instead of skipping.
+    """
+    env = resolved.env_type
+    fingerprint = deploy_fingerprint(env, config)
+    stack = build_stack(resolved, config, fingerprint)
 
-    return stack
+    if not force and deployed_fingerprint(stack) == fingerprint:
+        if unchanged == "preview":
+            stack.preview(on_output=on_output, diff=True)
+        on_output(f"{stack.name} is unchanged since the last deploy, skipping up")
+        return {"env": env.value, "outputs": stack.outputs(), "skipped": True}
 
+    profiler = DeploymentProfiler(stack.name) if profile else None
+    try:
+        up_res = stack.up(
+            on_output=on_output,
+            on_event=profiler.on_event if profiler else None,
+            refresh=True,
+            diff=True,
+        )
+    finally:
+        # A profile is also written for failed updates, but a profiler error
+        # must not replace the update's own exception.
+        if profiler:
+            try:
+                report = profiler.write(stack)
+                if dogstatsd:
+                    profiler.send_dogstatsd(report, tags=[f"env:{env.value}"])
+            except Exception as e:
+                on_output(f"could not write the profile for {stack.name}: {e}")
+    return {"env": env.value, "outputs": up_res.outputs, "skipped": False}
 
-def create_stack(
-    env: EnvType,
+
+def deploy_stacks(
     config: FullStackDeployment,
+    max_workers: int = 4,
+    force: bool = False,
+    unchanged: str = "skip",
+    profile: bool = False,
+    dogstatsd: bool = False,
 ) -> dict:
-    stack = build_stack(env, config)
-    up_res = stack.up(on_output=print, refresh=True, diff=True)
-    return {"env": env.value, "outputs": up_res.outputs}
+    """
+    Deploys the common stack first, then every other env stack in parallel.
+    A failing env is recorded in the status map and does not stop the others.
+    """
+    resolved = resolve_environments(config)
+
+    outputs: dict[str, dict] = {}
+    status: dict[str, str] = {}
+
+    def run(env: EnvType) -> None:
+        try:
+            result = create_stack(
+                resolved[env],
+                config,
+                on_output=prefixed_output(env),
+                force=force,
+                unchanged=unchanged,
+                profile=profile,
+                dogstatsd=dogstatsd,
+            )
+            outputs[env.value] = result["outputs"]
+            status[env.value] = "unchanged" if result["skipped"] else "succeeded"
+        except Exception as e:
+            print(f"[{env.value}] deploy failed: {e}", flush=True)
+            status[env.value] = "failed"
+
+    if EnvType.common in config.env_types:
+        run(EnvType.common)
+        if status[EnvType.common.value] == "failed":
+            for env in config.env_types:
+                if env != EnvType.common:
+                    status[env.value] = "skipped"
+            return {"outputs": outputs, "status": status}
+
+    envs = [env for env in config.env_types if env != EnvType.common]
+    if envs:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(run, env) for env in envs]
+            for future in as_completed(futures):
+                future.result()
+
+    return {"outputs": outputs, "status": status}
 
 
 def delete_stack(
     env: EnvType,
     config: FullStackDeployment,
 ) -> dict:
-    stack = build_stack(env, config)
+    stack = build_stack(resolve_environment(config, env), config)
     stack.destroy(on_output=print)
     stack.workspace.remove_stack(stack_name=stack.name)
 
 
 if __name__ == "__main__":
-    ws = auto.LocalWorkspace()
-    ws.install_plugin("github", "v6.7.0")
-    ws.install_plugin("digitalocean", "v4.40.1")
-    ws.install_plugin("auth0", "v3.14.0")
-    ws.install_plugin("ec", "v0.10.5")
-    ws.install_plugin("cloudflare", "v5.49.1")
-    ws.install_plugin_from_server(
-        "onepassword", "v1.1.3", "github://api.github.com/1Password/pulumi-onepassword"
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="run a full refresh + up even when an env's fingerprint is unchanged",
     )
-    ws.install_plugin("datadog", "v4.46.0")
+    parser.add_argument(
+        "--preview-unchanged",
+        action="store_true",
+        help="run a preview instead of skipping envs whose fingerprint is unchanged",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="write per-resource timings and the critical path to profiles/",
+    )
+    parser.add_argument(
+        "--dogstatsd",
+        action="store_true",
+        help="also send the profile timings to the local DogStatsD agent",
+    )
+    args = parser.parse_args()
+
+    ws = auto.LocalWorkspace()
+    for plugin in install_plugins(ws):
+        print(f"installed plugin {plugin}")
+    for chart in populate_chart_cache():
+        print(f"cached chart {chart}")
 
     standard_instance_type = InstancesType(
         db_size="db-s-1vcpu-1gb",
@@ -139,5 +247,15 @@ if __name__ == "__main__":
         ],
     )
 
-    for env in config.env_types:
-        create_stack(env, config)
+    result = deploy_stacks(
+        config,
+        force=args.force,
+        unchanged="preview" if args.preview_unchanged else "skip",
+        profile=args.profile or args.dogstatsd,
+        dogstatsd=args.dogstatsd,
+    )
+    for env, env_status in result["status"].items():
+        print(f"{env}: {env_status}")
+
+    if "failed" in result["status"].values():
+        raise SystemExit(1)
@@ -0,0 +1,113 @@
+import os
+import re
+import tomllib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from pydantic import BaseModel
+from pulumi import automation as auto
+
+pyproject_path = Path(__file__).parent / "pyproject.toml"
+
+
+class PulumiPlugin(BaseModel):
+    name: str
+    package: str | None = None
+    version: str | None = None
+    server: str | None = None
+
+
+# Plugin versions come from the matching SDK pin in pyproject.toml. Plugins
+# without a Python SDK dependency (cloudflare) carry their own version here.
+plugin_manifest: list[PulumiPlugin] = [
+    PulumiPlugin(name="github", package="pulumi-github"),
+    PulumiPlugin(name="digitalocean", package="pulumi-digitalocean"),
+    PulumiPlugin(name="auth0", package="pulumi-auth0"),
+    PulumiPlugin(name="ec", package="pulumi-ec"),
+    PulumiPlugin(name="cloudflare", version="5.49.1"),
+    PulumiPlugin(
+        name="onepassword",
+        package="pulumi-onepassword",
+        server="github://api.github.com/1Password/pulumi-onepassword",
+    ),
+    PulumiPlugin(name="datadog", package="pulumi-datadog"),
+]
+
+
+def pyproject_versions() -> dict[str, str]:
+    with open(pyproject_path, "rb") as f:
+        dependencies = tomllib.load(f)["tool"]["poetry"]["dependencies"]
+
+    versions: dict[str, str] = {}
+    for package, spec in dependencies.items():
+        if isinstance(spec, dict):
+            spec = spec.get("version", "")
+        versions[package] = re.sub(r"^[\^~=<>!]+", "", spec)
+    return versions
+
+
+def pinned_plugins() -> dict[str, PulumiPlugin]:
+    versions = pyproject_versions()
+    pinned: dict[str, PulumiPlugin] = {}
+    for plugin in plugin_manifest:
+        version = plugin.version or versions.get(plugin.package)
+        if version is None:
+            raise ValueError(
+                f"No version pinned for plugin '{plugin.name}' in pyproject.toml"
+            )
+        pinned[plugin.name] = plugin.model_copy(
+            update={"version": version.removeprefix("v")}
+        )
+    return pinned
+
+
+def plugin_cache_dir() -> Path:
+    pulumi_home = os.environ.get("PULUMI_HOME", Path.home() / ".pulumi")
+    return Path(pulumi_home) / "plugins"
+
+
+def installed_plugins() -> set[tuple[str, str]]:
+    """
+    Reads the local plugin cache directly instead of shelling out to
+    `pulumi plugin ls`. Entries look like `resource-<name>-v<version>`, and a
+    matching `.partial` marker means an install was interrupted.
+    """
+    cache_dir = plugin_cache_dir()
+    if not cache_dir.is_dir():
+        return set()
+
+    installed: set[tuple[str, str]] = set()
+    for entry in cache_dir.iterdir():
+        match = re.fullmatch(r"resource-(.+)-v(\d+\.\d+\.\d+.*)", entry.name)
+        if not match or not entry.is_dir():
+            continue
+        if entry.with_name(entry.name + ".partial").exists():
+            continue
+        installed.add((match.group(1), match.group(2)))
+    return installed
+
+
+def missing_plugins() -> list[PulumiPlugin]:
+    installed = installed_plugins()
+    return [
+        plugin
+        for plugin in pinned_plugins().values()
+        if (plugin.name, plugin.version) not in installed
+    ]
+
+
+def install_plugins(ws: auto.LocalWorkspace, max_workers: int = 4) -> list[str]:
+    def install(plugin: PulumiPlugin) -> str:
+        version = f"v{plugin.version}"
+        if plugin.server:
+            ws.install_plugin_from_server(plugin.name, version, plugin.server)
+        else:
+            ws.install_plugin(plugin.name, version)
+        return f"{plugin.name}@{version}"
+
+    missing = missing_plugins()
+    if not missing:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(install, missing))
@@ -0,0 +1,219 @@
+import json
+import socket
+import threading
+import time
+from pathlib import Path
+
+from pulumi import automation as auto
+from pulumi.automation import events
+
+# Maps the package of a resource type token to the setup module creating it.
+package_modules = {
+    "auth0": "auth0",
+    "datadog": "datadog",
+    "digitalocean": "digitalocean_setup",
+    "ec": "elastic_setup",
+    "github": "github",
+    "kubernetes": "kubernetes_setup",
+    "onepassword": "vault_setup",
+}
+
+# Packages used by several modules, attributed from the resource name first.
+package_name_hints = {
+    "datadog": {
+        "monitor-": "datadog_monitors",
+        "performance-dashboard": "datadog_monitors",
+    },
+}
+
+# Shared packages (random, time, ...) are attributed from the resource name.
+name_hints = {
+    "auth0": "auth0",
+    "digitalocean": "digitalocean_setup",
+    "django-secret-key": "digitalocean_setup",
+    "k8-cluster-readiness": "digitalocean_setup",
+    "rabbitmq": "kubernetes_setup",
+}
+
+
+def resource_module(urn: str, resource_type: str) -> str:
+    package = resource_type.split(":")[0]
+    name = urn.split("::")[-1]
+    for hint, module in package_name_hints.get(package, {}).items():
+        if hint in name:
+            return module
+    if package in package_modules:
+        return package_modules[package]
+
+    for hint, module in name_hints.items():
+        if hint in name:
+            return module
+    return "other"
+
+
+class DeploymentProfiler:
+    def __init__(self, stack_name: str) -> None:
+        self.stack_name = stack_name
+        self.started: dict[tuple[str, str], float] = {}
+        self.operations: list[dict] = []
+        self.lock = threading.Lock()
+
+    def on_event(self, event: events.EngineEvent) -> None:
+        if event.resource_pre_event:
+            metadata = event.resource_pre_event.metadata
+            if metadata.type == "pulumi:pulumi:Stack":
+                return
+            with self.lock:
+                self.started[(metadata.urn, metadata.op.value)] = time.monotonic()
+            return
+
+        if event.res_outputs_event:
+            self._finish(event.res_outputs_event.metadata, "succeeded")
+        elif event.res_op_failed_event:
+            self._finish(event.res_op_failed_event.metadata, "failed")
+
+    def _finish(self, metadata: events.StepEventMetadata, status: str) -> None:
+        with self.lock:
+            start = self.started.pop((metadata.urn, metadata.op.value), None)
+            if start is None:
+                return
+            self.operations.append(
+                {
+                    "urn": metadata.urn,
+                    "type": metadata.type,
+                    "op": metadata.op.value,
+                    "module": resource_module(metadata.urn, metadata.type),
+                    "status": status,
+                    "start": start,
+                    "duration_seconds": time.monotonic() - start,
+                }
+            )
+
+    def resource_durations(self) -> dict[str, float]:
+        durations: dict[str, float] = {}
+        for operation in self.operations:
+            durations[operation["urn"]] = (
+                durations.get(operation["urn"], 0.0) + operation["duration_seconds"]
+            )
+        return durations
+
+    def module_durations(self) -> dict[str, float]:
+        durations: dict[str, float] = {}
+        for operation in self.operations:
+            durations[operation["module"]] = (
+                durations.get(operation["module"], 0.0) + operation["duration_seconds"]
+            )
+        return dict(sorted(durations.items(), key=lambda x: x[1], reverse=True))
+
+    def critical_path(self, deployment: dict) -> dict:
+        """
+        Longest chain of resource durations through the dependency graph of
+        the exported deployment. Provider references count as dependencies.
+        """
+        durations = self.resource_durations()
+        dependencies: dict[str, list[str]] = {}
+        for resource in deployment.get("resources", []):
+            deps = list(resource.get("dependencies", []))
+            if resource.get("provider"):
+                deps.append(resource["provider"].rsplit("::", 1)[0])
+            dependencies[resource["urn"]] = deps
+
+        longest: dict[str, tuple[float, list[str]]] = {}
+
+        def visit(urn: str) -> tuple[float, list[str]]:
+            if urn not in longest:
+                best = max(
+                    (visit(dep) for dep in dependencies.get(urn, [])),
+                    key=lambda x: x[0],
+                    default=(0.0, []),
+                )
+                longest[urn] = (best[0] + durations.get(urn, 0.0), best[1] + [urn])
+            return longest[urn]
+
+        total, chain = max(
+            (visit(urn) for urn in dependencies),
+            key=lambda x: x[0],
+            default=(0.0, []),
+        )
+        return {
+            "total_seconds": total,
+            "resources": [
+                {"urn": urn, "duration_seconds": durations.get(urn, 0.0)}
+                for urn in chain
+            ],
+        }
+
+    def report(self, deployment: dict | None = None) -> dict:
+        with self.lock:
+            operations = sorted(self.operations, key=lambda x: x["start"])
+        first_start = operations[0]["start"] if operations else 0.0
+        return {
+            "stack": self.stack_name,
+            "operations": [
+                {**operation, "start": operation["start"] - first_start}
+                for operation in operations
+            ],
+            "modules": self.module_durations(),
+            "critical_path": self.critical_path(deployment or {}),
+        }
+
+    def folded(self) -> str:
+        """
+        Collapsed-stack lines (stack;module;type;name milliseconds) that
+        flamegraph.pl and speedscope can load directly.
+        """
+        lines = []
+        for operation in self.operations:
+            name = operation["urn"].split("::")[-1]
+            frames = [self.stack_name, operation["module"], operation["type"], name]
+            lines.append(
+                f"{';'.join(frames)} {int(operation['duration_seconds'] * 1000)}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def write(self, stack: auto.Stack, output_dir: str = "profiles") -> dict:
+        report = self.report(stack.export_stack().deployment)
+        path = Path(output_dir)
+        path.mkdir(parents=True, exist_ok=True)
+        (path / f"{self.stack_name}.json").write_text(json.dumps(report, indent=2))
+        (path / f"{self.stack_name}.folded").write_text(self.folded())
+        return report
+
+    def send_dogstatsd(
+        self,
+        report: dict,
+        host: str = "localhost",
+        port: int = 8125,
+        tags: list[str] | None = None,
+    ) -> None:
+        base_tags = [f"stack:{self.stack_name}"] + (tags or [])
+
+        def packet(metric: str, value: float, extra_tags: list[str]) -> bytes:
+            return (
+                f"pulumi.deploy.{metric}:{value * 1000:.0f}|ms"
+                f"|#{','.join(base_tags + extra_tags)}"
+            ).encode("utf-8")
+
+        packets = [
+            packet(
+                "resource.duration",
+                operation["duration_seconds"],
+                [
+                    f"module:{operation['module']}",
+                    f"resource_type:{operation['type']}",
+                    f"op:{operation['op']}",
+                    f"status:{operation['status']}",
+                ],
+            )
+            for operation in report["operations"]
+        ]
+        packets += [
+            packet("module.duration", duration, [f"module:{module}"])
+            for module, duration in report["modules"].items()
+        ]
+        critical_path = report["critical_path"]["total_seconds"]
+        packets.append(packet("critical_path.duration", critical_path, []))
+
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for data in packets:
+                sock.sendto(data, (host, port))
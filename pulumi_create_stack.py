@@ -1,71 +1,177 @@
-from auth0 import setup_auth0
-from datadog import setup_datadog
-from digitalocean_setup import DigitalOceanSetup
-from elastic_setup import ElasticCloudSetup
-from github import setup_github
-from kubernetes_setup import KubernetesSetup
+import importlib
+import json
+import sys
+import time
+from typing import Callable
+
+from invokes import Lookups
 from schema import (
     EnvType,
     FullStackDeployment,
+    ResolvedEnvironment,
 )
 
-from vault_setup import VaultSetup
+# Setup modules import their provider SDKs at import time, so they are only
+# loaded once a step that needs them is selected for the env.
+import_times: dict[str, float] = {}
 
 
-def create_pulumi_program(
-    env_type: EnvType,
+def load_module(name: str):
+    if name not in sys.modules:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        import_times[name] = time.perf_counter() - start
+    return sys.modules[name]
+
+
+def run_github(
+    env: ResolvedEnvironment,
     config: FullStackDeployment,
+    outputs: dict,
+    lookups: Lookups,
 ):
-    if env_type == EnvType.common:
-        github = setup_github(config)
-        datadog = setup_datadog(config)
-        VaultSetup(
-            env_type,
-            config,
-            {
-                "github": github,
-                "datadog": datadog,
-            },
-        ).setup()
-        return
+    outputs["github"] = load_module("github").setup_github(env, config, lookups)
+
+
+def run_datadog(
+    env: ResolvedEnvironment,
+    config: FullStackDeployment,
+    outputs: dict,
+    lookups: Lookups,
+):
+    outputs["datadog"] = load_module("datadog").setup_datadog(env, config)
+
+
+def run_auth0(
+    env: ResolvedEnvironment,
+    config: FullStackDeployment,
+    outputs: dict,
+    lookups: Lookups,
+):
+    outputs["auth0"] = load_module("auth0").setup_auth0(env, config, lookups)
 
-    if env_type == EnvType.local:
-        auth = setup_auth0(env_type, config)
-        VaultSetup(
-            env_type,
-            config,
-            {
-                "auth0": auth,
-            },
-        ).setup()
 
-    if env_type in [EnvType.staging, EnvType.dev, EnvType.prod]:
-        auth = setup_auth0(env_type, config)
-        do = DigitalOceanSetup(env_type, config)
-        do_config, k8_provider = do.setup()
+def run_digitalocean(
+    env: ResolvedEnvironment,
+    config: FullStackDeployment,
+    outputs: dict,
+    lookups: Lookups,
+):
+    do = load_module("digitalocean_setup").DigitalOceanSetup(env, config, lookups)
+    outputs["digitalocean"], outputs["k8_provider"] = do.setup()
+
+
+def run_elastic(
+    env: ResolvedEnvironment,
+    config: FullStackDeployment,
+    outputs: dict,
+    lookups: Lookups,
+):
+    outputs["elastic"] = (
+        load_module("elastic_setup").ElasticCloudSetup(env, config, lookups).setup()
+    )
 
-        es = ElasticCloudSetup(env_type, config)
-        es_config = es.setup()
 
-        k8 = KubernetesSetup(
-            env_type,
+def run_kubernetes(
+    env: ResolvedEnvironment,
+    config: FullStackDeployment,
+    outputs: dict,
+    lookups: Lookups,
+):
+    outputs["kubernetes"] = (
+        load_module("kubernetes_setup")
+        .KubernetesSetup(
+            env,
             config,
-            k8_provider,
+            outputs["k8_provider"],
             {
-                "digitalocean": do_config,
-                "elastic": es_config,
-                "auth0": auth,
+                "digitalocean": outputs["digitalocean"],
+                "elastic": outputs["elastic"],
+                "auth0": outputs["auth0"],
             },
         )
-        k8_secrets = k8.setup()
+        .setup()
+    )
 
-        VaultSetup(
-            env_type,
-            config,
-            {
-                "digitalocean": do_config,
-                "elastic": es_config,
-                "auth0": auth,
-                "kubernetes": k8_secrets,
-            },
-        ).setup()
+
+def run_datadog_monitors(
+    env: ResolvedEnvironment,
+    config: FullStackDeployment,
+    outputs: dict,
+    lookups: Lookups,
+):
+    outputs["datadog_monitors"] = load_module(
+        "datadog_monitors"
+    ).setup_datadog_monitors(env, config)
+
+
+step_runners: dict[str, tuple[str, Callable]] = {
+    "github": ("github", run_github),
+    "datadog": ("datadog", run_datadog),
+    "auth0": ("auth0", run_auth0),
+    "digitalocean": ("digitalocean_setup", run_digitalocean),
+    "elastic": ("elastic_setup", run_elastic),
+    "kubernetes": ("kubernetes_setup", run_kubernetes),
+    "datadog_monitors": ("datadog_monitors", run_datadog_monitors),
+}
+
+cloud_steps = [
+    "auth0",
+    "digitalocean",
+    "elastic",
+    "kubernetes",
+    "datadog_monitors",
+]
+cloud_vault_sections = ["digitalocean", "elastic", "auth0", "kubernetes"]
+
+program_steps: dict[EnvType, list[str]] = {
+    EnvType.common: ["github", "datadog"],
+    EnvType.local: ["auth0"],
+    EnvType.dev: cloud_steps,
+    EnvType.staging: cloud_steps,
+    EnvType.prod: cloud_steps,
+}
+
+# Section order is kept stable, the vault item is replaced when it changes.
+vault_sections: dict[EnvType, list[str]] = {
+    EnvType.common: ["github", "datadog"],
+    EnvType.local: ["auth0"],
+    EnvType.dev: cloud_vault_sections,
+    EnvType.staging: cloud_vault_sections,
+    EnvType.prod: cloud_vault_sections,
+}
+
+
+def create_pulumi_program(
+    env: ResolvedEnvironment,
+    config: FullStackDeployment,
+    lookups: Lookups | None = None,
+):
+    lookups = lookups or Lookups(env)
+    lookups.prefetch(config.project_name)
+
+    outputs: dict = {}
+    for step in program_steps[env.env_type]:
+        _, runner = step_runners[step]
+        runner(env, config, outputs, lookups)
+
+    load_module("vault_setup").VaultSetup(
+        env,
+        config,
+        {section: outputs[section] for section in vault_sections[env.env_type]},
+    ).setup()
+
+
+def import_report(env_type: EnvType) -> dict[str, float]:
+    """
+    Import cost of every module the env's program loads. Only meaningful in a
+    fresh interpreter, modules already imported are not timed again.
+    """
+    modules = [step_runners[step][0] for step in program_steps[env_type]]
+    for module in modules + ["vault_setup"]:
+        load_module(module)
+    return dict(import_times)
+
+
+if __name__ == "__main__":
+    print(json.dumps(import_report(EnvType(sys.argv[1])), indent=2))
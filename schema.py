@@ -15,23 +15,171 @@ class WebappAuthType(StrEnum):
     b2b = "b2b"
 
 
+class Auth0ScopeMode(StrEnum):
+    # One ResourceServerScope resource per permission:entity pair.
+    per_scope = "per_scope"
+    # Keeps the per-scope resources with retain_on_delete alongside the bulk
+    # resource, run once before switching to bulk so no scope is deleted.
+    migrate = "migrate"
+    # All scopes managed by a single ResourceServerScopes resource.
+    bulk = "bulk"
+
+
+class PoolMode(StrEnum):
+    session = "session"
+    transaction = "transaction"
+    statement = "statement"
+
+
+class DatabaseWorkload(BaseModel):
+    name: str
+    replicas: int = 1
+    processes_per_replica: int = 1
+    connections_per_process: int = 1
+    mode: PoolMode = PoolMode.transaction
+
+
+class PostgresReplica(BaseModel):
+    name: str
+    # Fall back to the primary's db_size and default_region when unset.
+    size: str | None = None
+    region: str | None = None
+    pool_size: int = 20
+
+
+class CacheCluster(BaseModel):
+    name: str
+    size: str = "db-s-1vcpu-1gb"
+    node_count: int = 1
+    tuning_profile: str | None = None
+    # Overrides the maxmemory-policy of the tuning profile.
+    eviction_policy: str | None = None
+
+
+class NodeTaint(BaseModel):
+    key: str
+    value: str
+    effect: str = "NoSchedule"
+
+
+class NodePool(BaseModel):
+    name: str
+    size: str = "s-4vcpu-8gb"
+    min_nodes: int = 1
+    max_nodes: int = 3
+    labels: dict[str, str] = {}
+    taints: list[NodeTaint] = []
+
+
+class CeleryQueueScaling(BaseModel):
+    queue: str
+    deployment: str = "celery-worker"
+    target_length: int = 20
+    min_replicas: int = 1
+    max_replicas: int = 10
+    cooldown_period: int = 300
+    polling_interval: int = 30
+
+
+class RequestRateScaling(BaseModel):
+    deployment: str
+    # Regex on the HAProxy backend (proxy label), defaults to the deployment.
+    backend: str | None = None
+    requests_per_second: int = 100
+    queue_time_ms: int = 100
+    min_replicas: int = 1
+    max_replicas: int = 10
+    cooldown_period: int = 300
+    polling_interval: int = 30
+
+
+class CapacityWindow(BaseModel):
+    name: str
+    # Cron expressions opening and closing the window.
+    start: str
+    end: str
+    timezone: str = "Europe/London"
+    # Default node pool bounds inside the window.
+    min_nodes: int | None = None
+    max_nodes: int | None = None
+    # Replica floor for every Celery worker deployment inside the window.
+    worker_min_replicas: int | None = None
+
+
+class DatadogMonitoring(BaseModel):
+    # Database Monitoring (query metrics, samples and explain plans) for Postgres.
+    database_monitoring: bool = True
+    apm_enabled: bool = True
+    profiling_enabled: bool = True
+    trace_sample_rate: float = 1.0
+
+
+class PerformanceThresholds(BaseModel):
+    # Trace latency in seconds.
+    api_p95_latency: float = 0.5
+    api_p99_latency: float = 1.5
+    webapp_p95_latency: float = 1.0
+    webapp_p99_latency: float = 3.0
+    queue_depth_warning: int = 100
+    queue_depth_critical: int = 500
+    # Minutes a Celery queue may stay non-empty before it is treated as stuck.
+    queue_backlog_minutes: int = 15
+    pg_connection_usage: float = 0.8
+    valkey_memory_usage: float = 0.9
+    valkey_evictions_per_second: float = 1.0
+    haproxy_queue_time_ms: int = 100
+    # Appended to every monitor message, e.g. "@slack-alerts".
+    notify: str = ""
+
+
+class LogPolicy(BaseModel):
+    service: str
+    # Lines matching any of these are dropped by the agent.
+    exclude_patterns: list[str] = []
+    # Start of a new log record, following lines are joined to it.
+    multiline_pattern: str | None = None
+
+
 class InstancesType(BaseModel):
     db_size: str = "db-s-1vcpu-1gb"
     k8_node_pool_size: str = "s-4vcpu-8gb"
     k8_min_node_count: int = 4
     k8_max_node_count: int = 6
+    k8_ready_timeout_seconds: int = 600
+    # Additional autoscaling node pools next to the default one.
+    k8_node_pools: list[NodePool] = []
+    # KEDA scaling of Celery worker deployments on RabbitMQ queue length.
+    celery_queues: list[CeleryQueueScaling] = []
+    # KEDA scaling on HAProxy request rate and backend queue time.
+    haproxy_scaling: RequestRateScaling | None = None
+    rest_api_scaling: RequestRateScaling | None = None
+    capacity_windows: list[CapacityWindow] = []
 
     caching_size: str = "db-s-1vcpu-1gb"
     caching_node_count: int = 1
+    # Named engine tuning profiles from database_tuning.py.
+    pg_tuning_profile: str | None = None
+    caching_tuning_profile: str | None = None
+    # Additional Valkey clusters (cache, celery results, channels, ...).
+    caches: list[CacheCluster] = []
     pg_pool_size: int = 20
     default_region: str = "lon1"
     db_cluster_node_count: int = 1
+    pg_replicas: list[PostgresReplica] = []
+    # One connection pool per workload, replaces the shared pg_pool_size pool.
+    pg_workloads: list[DatabaseWorkload] = []
 
     maintenance_window_day: str = "sunday"
     maintenance_window_time: str = "04:00"
 
     es_instance_size: str = "gcp-storage-optimized"
 
+    datadog: DatadogMonitoring = DatadogMonitoring()
+    thresholds: PerformanceThresholds = PerformanceThresholds()
+    log_policies: list[LogPolicy] = []
+    # Agent-wide limit, longer log messages are truncated rather than dropped.
+    log_max_message_bytes: int | None = None
+
 
 class EnvInstanceType(BaseModel):
     instances: InstancesType
@@ -130,6 +278,9 @@ class FullStackDeployment(BaseModel):
     main_domain: str
     env_vars: list[EnvVars] = []
     providers: list[EnvProviders]
+    auth0_scope_mode: Auth0ScopeMode = Auth0ScopeMode.per_scope
+    # role -> ["permission:entity", ...], either side may be "*".
+    role_permissions: dict[str, list[str]] = {}
 
 
 class Auth0WebappSetupOutput(BaseModel):
@@ -168,3 +319,99 @@ class DataDogSetupOutput(BaseModel):
     application_id: str
     site: str
     app_name: str
+
+
+class ResolvedEnvironment(BaseModel):
+    env_type: EnvType
+    project_name: str
+    resource_prefix: str
+    provider: Provider
+    instances: InstancesType | None = None
+    main_domain: str
+    api_identifier: str
+    webapp_urls: dict[str, str] = {}
+
+
+def webapp_url(env_type: EnvType, webapp: Webapp, main_domain: str) -> str:
+    if env_type == EnvType.local:
+        return f"http://localhost:{webapp.dev_port}"
+    if env_type == EnvType.dev:
+        return f"https://qa-{webapp.name}.{main_domain}"
+    if env_type == EnvType.staging:
+        return f"https://staging-{webapp.name}.{main_domain}"
+    if env_type == EnvType.prod and webapp.is_root:
+        return f"https://{main_domain}"
+    if env_type == EnvType.prod:
+        return f"https://{webapp.name}.{main_domain}"
+    return ""
+
+
+def _resolve_environment(
+    config: FullStackDeployment,
+    env_type: EnvType,
+    providers: dict[EnvType, Provider],
+    instances: dict[EnvType, InstancesType],
+) -> ResolvedEnvironment:
+    if env_type not in providers:
+        raise ValueError(f"No provider configured for env '{env_type.value}'")
+    if (
+        env_type in [EnvType.dev, EnvType.staging, EnvType.prod]
+        and env_type not in instances
+    ):
+        raise ValueError(f"No instances configured for env '{env_type.value}'")
+
+    env_instances = instances.get(env_type)
+    # Worker floors are KEDA cron triggers on the Celery ScaledObjects, which
+    # only exist for configured queues.
+    if (
+        env_instances
+        and not env_instances.celery_queues
+        and any(
+            window.worker_min_replicas is not None
+            for window in env_instances.capacity_windows
+        )
+    ):
+        raise ValueError(
+            f"Capacity windows for env '{env_type.value}' set worker_min_replicas "
+            "but no celery_queues are configured"
+        )
+
+    return ResolvedEnvironment(
+        env_type=env_type,
+        project_name=config.project_name,
+        resource_prefix=f"{env_type.value}-{config.project_name}-",
+        provider=providers[env_type],
+        instances=instances.get(env_type),
+        main_domain=config.main_domain,
+        api_identifier=f"https://{env_type.value}-api-{config.project_name}.{config.main_domain}",
+        webapp_urls={
+            webapp.name: webapp_url(env_type, webapp, config.main_domain)
+            for webapp in config.webapps
+        },
+    )
+
+
+def resolve_environment(
+    config: FullStackDeployment, env_type: EnvType
+) -> ResolvedEnvironment:
+    return _resolve_environment(
+        config,
+        env_type,
+        {entry.env_type: entry.provider for entry in config.providers},
+        {entry.env_type: entry.instances for entry in config.instances},
+    )
+
+
+def resolve_environments(
+    config: FullStackDeployment,
+) -> dict[EnvType, ResolvedEnvironment]:
+    """
+    Indexes providers and instances by env once and fails fast when an env in
+    `env_types` is missing the entries its program needs.
+    """
+    providers = {entry.env_type: entry.provider for entry in config.providers}
+    instances = {entry.env_type: entry.instances for entry in config.instances}
+    return {
+        env_type: _resolve_environment(config, env_type, providers, instances)
+        for env_type in config.env_types
+    }
@@ -0,0 +1,59 @@
+from pulumi import automation as auto
+from schema import Provider
+
+
+def desired_stack_config(provider: Provider) -> dict[str, auto.ConfigValue]:
+    return {
+        "digitalocean:token": auto.ConfigValue(
+            provider.digitalocean.token, secret=True
+        ),
+        "digitalocean:spacesAccessId": auto.ConfigValue(
+            provider.digitalocean.spaces_access_id
+        ),
+        "digitalocean:spacesSecretKey": auto.ConfigValue(
+            provider.digitalocean.spaces_secret_key, secret=True
+        ),
+        "ec:apikey": auto.ConfigValue(provider.elastic.api_key, secret=True),
+        "auth0:clientId": auto.ConfigValue(provider.auth0.client_id),
+        "auth0:clientSecret": auto.ConfigValue(
+            provider.auth0.client_secret, secret=True
+        ),
+        "auth0:domain": auto.ConfigValue(provider.auth0.domain),
+        "github:token": auto.ConfigValue(provider.github.token, secret=True),
+        "github:owner": auto.ConfigValue(provider.github.owner),
+        "cloudflare:apiToken": auto.ConfigValue(provider.cloudflare.token, secret=True),
+        "datadog:apiKey": auto.ConfigValue(provider.datadog.api_key, secret=True),
+        "datadog:apiUrl": auto.ConfigValue(provider.datadog.api_url),
+        "datadog:appKey": auto.ConfigValue(provider.datadog.app_key, secret=True),
+        "onepassword:serviceAccountToken": auto.ConfigValue(
+            provider.onepassword.service_account_token, secret=True
+        ),
+    }
+
+
+def changed_stack_config(
+    current: dict[str, auto.ConfigValue], desired: dict[str, auto.ConfigValue]
+) -> dict[str, auto.ConfigValue]:
+    changed: dict[str, auto.ConfigValue] = {}
+    for key, value in desired.items():
+        existing = current.get(key)
+        if (
+            existing is None
+            or existing.value != value.value
+            or existing.secret != value.secret
+        ):
+            changed[key] = value
+    return changed
+
+
+def sync_stack_config(stack: auto.Stack, provider: Provider) -> list[str]:
+    """
+    Reads the stack config once and writes only the keys that differ from the
+    provider model in a single `set_all_config` call.
+    """
+    changed = changed_stack_config(
+        stack.get_all_config(), desired_stack_config(provider)
+    )
+    if changed:
+        stack.set_all_config(changed)
+    return sorted(changed.keys())
@@ -0,0 +1,46 @@
+import copy
+import json
+import threading
+from pathlib import Path
+
+import jinja2
+import yaml
+from pulumi import Input, Output
+
+template_dir = Path(__file__).parent / "templates"
+
+# Templates are compiled once per process, a missing variable raises instead of
+# rendering an empty string.
+environment = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(template_dir),
+    undefined=jinja2.StrictUndefined,
+    auto_reload=False,
+    keep_trailing_newline=True,
+)
+
+render_cache: dict[tuple[str, str], dict] = {}
+render_lock = threading.Lock()
+
+
+def render_values(name: str, **context) -> dict:
+    """
+    Renders a YAML template and parses it, memoised by the template name and
+    the resolved context. Callers get their own copy of the parsed values.
+    """
+    key = (name, json.dumps(context, sort_keys=True, default=str))
+    with render_lock:
+        values = render_cache.get(key)
+    if values is None:
+        values = yaml.safe_load(environment.get_template(name).render(**context))
+        with render_lock:
+            render_cache[key] = values or {}
+    return copy.deepcopy(values or {})
+
+
+def chart_values(chart: str, **inputs: Input) -> Output[dict]:
+    """
+    Values for a Helm chart from `templates/<chart>.yaml`, rendered once every
+    input has resolved. Secret inputs keep the values secret.
+    """
+    context = Output.all(**inputs) if inputs else Output.from_input({})
+    return context.apply(lambda context: render_values(f"{chart}.yaml", **context))
@@ -1,21 +1,21 @@
 from pulumi import Output, ResourceOptions
-from schema import EnvType, FullStackDeployment
+from schema import FullStackDeployment, ResolvedEnvironment
 import pulumi_onepassword as onepassword
 from collections.abc import MutableMapping
 
 
 class VaultSetup:
     def __init__(
-        self, env_type: EnvType, config: FullStackDeployment, secret_values: dict
+        self,
+        env: ResolvedEnvironment,
+        config: FullStackDeployment,
+        secret_values: dict,
     ) -> None:
-        self.env_type = env_type
+        self.env_type = env.env_type
         self.config = config
-        self.resource_prefix = f"{env_type.value}-{config.project_name}-"
+        self.resource_prefix = env.resource_prefix
         self.secret_values: dict[str, Output[str]] = secret_values
-        provider = list(
-            filter(lambda x: x.env_type == self.env_type, config.providers)
-        )[0].provider
-        self.onepassword_provider = provider.onepassword
+        self.onepassword_provider = env.provider.onepassword
 
     def flatten(self, dictionary, parent_key="", separator="_"):
         items = []